@@ -0,0 +1,281 @@
+"""
+Aggregates
+Precomputed summaries of encroachment results for city-scale views
+
+Grid aggregates bin buildings into square cells at several sizes so the map
+can draw one choropleth polygon per cell instead of one marker per building
+when zoomed out. The analytics cube sums the same results by severity,
+building type, month and road segment so dashboard charts and metrics cost
+the same however many buildings were analysed. Segment rankings order the
+fixed-length chainage segments of each road for field surveys.
+"""
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from severity import ENCROACHING_LEVELS
+
+
+# Square cell sizes in meters, coarsest first
+GRID_CELL_SIZES = (2000, 1000, 500, 250)
+
+# Dimensions of the analytics cube, in group-by order
+CUBE_DIMENSIONS = ('severity', 'building_type', 'month', 'road_name', 'segment')
+
+# Histogram bin edges in meters; values past the last edge share a final bin
+HISTOGRAM_EDGES = np.arange(0, 62, 2)
+
+
+def build_grid_aggregates(results, cell_sizes=GRID_CELL_SIZES, crs="EPSG:32737"):
+    """
+    Encroachment counts, severity mix and overlap area per grid cell
+
+    Parameters:
+    -----------
+    results : DataFrame
+        Result table with ``latitude``/``longitude``, ``is_encroachment``
+        and ``severity`` columns, optionally ``overlap_area_m2``
+    cell_sizes : iterable of float
+        Cell edge lengths in meters, one grid per size
+    crs : str
+        Metric CRS the grid is laid out in
+
+    Returns:
+    --------
+    GeoDataFrame in EPSG:4326 with one row per non-empty cell and size
+    """
+    points = gpd.GeoSeries(
+        gpd.points_from_xy(results['longitude'], results['latitude']),
+        crs="EPSG:4326"
+    ).to_crs(crs)
+    x = points.x.to_numpy()
+    y = points.y.to_numpy()
+
+    # Indicator columns summed per cell in a single groupby
+    values = pd.DataFrame({
+        'buildings': 1,
+        'encroachments': results['is_encroachment'].to_numpy(dtype=np.int64),
+        'overlap_area_m2': (
+            results['overlap_area_m2'].to_numpy()
+            if 'overlap_area_m2' in results else 0.0
+        ),
+    })
+    severity = results['severity'].astype(str).to_numpy()
+    encroaching = results['is_encroachment'].to_numpy(dtype=bool)
+    for level in ENCROACHING_LEVELS:
+        values[level.lower()] = ((severity == level) & encroaching).astype(np.int64)
+
+    grids = []
+    for size in cell_sizes:
+        cells = values.assign(
+            ix=np.floor(x / size).astype(np.int64),
+            iy=np.floor(y / size).astype(np.int64)
+        ).groupby(['ix', 'iy'], sort=True).sum().reset_index()
+
+        cells['cell_size'] = size
+        cells['geometry'] = shapely.box(
+            cells['ix'] * size, cells['iy'] * size,
+            (cells['ix'] + 1) * size, (cells['iy'] + 1) * size
+        )
+        grids.append(cells)
+
+    grid = pd.concat(grids, ignore_index=True)
+    grid['encroachment_rate'] = grid['encroachments'] / grid['buildings'] * 100
+
+    return gpd.GeoDataFrame(grid, geometry='geometry', crs=crs).to_crs("EPSG:4326")
+
+
+def cell_size_for_zoom(zoom, cell_sizes=GRID_CELL_SIZES, detail_zoom=15,
+                       target_pixels=40):
+    """
+    Grid size to draw at a web map zoom level, or None for point detail
+
+    Picks the cell size closest to ``target_pixels`` on screen.
+    """
+    if zoom is None or zoom >= detail_zoom:
+        return None
+
+    # Web Mercator ground resolution near the equator
+    meters_per_pixel = 156543.03 / 2 ** zoom
+    target = meters_per_pixel * target_pixels
+    return min(cell_sizes, key=lambda size: abs(np.log(size / target)))
+
+
+def build_analytics_cube(results, value_column='distance_meters', type_column='building',
+                         date_column=None, road_column='road_name', segment_column='segment',
+                         bin_edges=HISTOGRAM_EDGES):
+    """
+    Counts, sums and histograms by severity, building type, month and road segment
+
+    Parameters:
+    -----------
+    results : DataFrame
+        Result table with a ``severity`` column, optionally
+        ``is_encroachment`` (every row counts as encroaching without it)
+        and ``area_m2``
+    value_column : str
+        Measure summed and histogrammed per cell, e.g. distance or depth
+    type_column : str
+        Column holding the building type
+    date_column : str
+        Optional datetime column binned to months; without it every row
+        falls in month 'all'
+    road_column : str
+        Road the segment numbers count along; without it every row falls
+        on road 'unknown'
+    segment_column : str
+        Road segment number along the road (see
+        ``EncroachmentDataLoader.calculate_chainage``); segments are keyed
+        by road and number, as numbering restarts on every road
+    bin_edges : array-like
+        Histogram bin edges of ``value_column``
+
+    Returns:
+    --------
+    DataFrame with one row per non-empty combination of the dimensions and
+    columns buildings, encroachments, area_m2, value_sum and hist_NN
+    """
+    n = len(results)
+
+    def column_or(name, default):
+        return results[name].to_numpy() if name in results else np.full(n, default)
+
+    cube = pd.DataFrame({
+        'severity': results['severity'].astype(str).to_numpy(),
+        'building_type': pd.Series(column_or(type_column, None)).fillna('unknown').astype(str).to_numpy(),
+        'month': (
+            pd.to_datetime(results[date_column]).dt.to_period('M').astype(str).to_numpy()
+            if date_column in results else np.full(n, 'all')
+        ),
+        'road_name': pd.Series(column_or(road_column, None)).fillna('unknown').astype(str).to_numpy(),
+        'segment': column_or(segment_column, -1).astype(np.int64),
+        'buildings': np.ones(n, dtype=np.int64),
+        'encroachments': column_or('is_encroachment', True).astype(np.int64),
+        'area_m2': column_or('area_m2', 0.0).astype(float),
+    })
+
+    values = results[value_column].to_numpy(dtype=float)
+    cube['value_sum'] = np.nan_to_num(values)
+
+    # One indicator column per histogram bin, summed in the same groupby
+    bins = np.digitize(values, bin_edges[1:])
+    for i in range(len(bin_edges)):
+        cube[f'hist_{i:02d}'] = ((bins == i) & ~np.isnan(values)).astype(np.int64)
+
+    cube = cube.groupby(list(CUBE_DIMENSIONS), sort=True).sum().reset_index()
+    cube.attrs['value_column'] = value_column
+    cube.attrs['bin_edges'] = [float(edge) for edge in bin_edges]
+
+    return cube
+
+
+def cube_select(cube, **selections):
+    """
+    Cube rows matching a selection, e.g. ``severity=['Critical', 'High']``
+    """
+    keep = np.ones(len(cube), dtype=bool)
+    for dimension, values in selections.items():
+        keep &= cube[dimension].isin(list(values)).to_numpy()
+    return cube[keep]
+
+
+def cube_totals(cube, by=None):
+    """
+    Measures summed over the cube, or per value of the ``by`` dimension(s)
+    """
+    measures = [column for column in cube.columns if column not in CUBE_DIMENSIONS]
+    if by is None:
+        return cube[measures].sum()
+    return cube.groupby(by)[measures].sum()
+
+
+def cube_histogram(cube, bin_edges=HISTOGRAM_EDGES):
+    """
+    Histogram of the cube's value column as (bin start, bin end, count) rows
+    """
+    counts = cube_totals(cube)[[f'hist_{i:02d}' for i in range(len(bin_edges))]]
+    starts = np.asarray(bin_edges, dtype=float)
+    ends = np.append(starts[1:], np.inf)
+    return pd.DataFrame({
+        'start': starts, 'end': ends, 'count': counts.to_numpy(dtype=np.int64)
+    })
+
+
+def sample_points(df, max_points=2000, stratify='severity', seed=0):
+    """
+    At most ``max_points`` rows for scatter plots, keeping each group's share
+
+    Small groups keep at least one row so rare classes stay visible.
+    """
+    if len(df) <= max_points:
+        return df
+
+    rng = np.random.default_rng(seed)
+    if stratify is None or stratify not in df:
+        return df.iloc[np.sort(rng.choice(len(df), max_points, replace=False))]
+
+    fraction = max_points / len(df)
+    # Codes rather than labels: categoricals and missing values group alike
+    groups = pd.factorize(df[stratify])[0]
+    keep = []
+    for group in np.unique(groups):
+        rows = np.flatnonzero(groups == group)
+        keep.append(rng.choice(rows, max(1, int(round(len(rows) * fraction))), replace=False))
+
+    return df.iloc[np.sort(np.concatenate(keep))]
+
+
+def rank_segments(results, segment_length=100):
+    """
+    Fixed-length road segments ranked by encroachments, worst first
+
+    Parameters:
+    -----------
+    results : DataFrame
+        Result table with ``road_name``, ``segment`` and ``chainage_m``
+        (from ``EncroachmentDataLoader.calculate_chainage``) plus
+        ``is_encroachment``, ``severity`` and latitude/longitude
+    segment_length : float
+        Segment length the results were binned with
+
+    Returns:
+    --------
+    DataFrame with one row per segment holding buildings: start_m, end_m,
+    building and encroachment counts, counts per severity level, overlap
+    area and the mean location of its encroaching buildings, sorted by
+    encroachments, then critical cases
+    """
+    located = results[results['segment'].to_numpy() >= 0]
+    encroaching = located['is_encroachment'].to_numpy(dtype=bool)
+    severity = located['severity'].astype(str).to_numpy()
+
+    values = pd.DataFrame({
+        'road_name': located['road_name'].to_numpy(),
+        'segment': located['segment'].to_numpy(),
+        'buildings': 1,
+        'encroachments': encroaching.astype(np.int64),
+        'overlap_area_m2': (
+            located['overlap_area_m2'].to_numpy() if 'overlap_area_m2' in located else 0.0
+        ),
+        # Location sums over encroaching buildings only, divided below
+        'latitude': np.where(encroaching, located['latitude'].to_numpy(), 0.0),
+        'longitude': np.where(encroaching, located['longitude'].to_numpy(), 0.0),
+    })
+    for level in ENCROACHING_LEVELS:
+        values[level.lower()] = ((severity == level) & encroaching).astype(np.int64)
+
+    segments = values.groupby(['road_name', 'segment'], sort=False).sum().reset_index()
+    segments = segments[segments['encroachments'] > 0]
+    segments['latitude'] /= segments['encroachments']
+    segments['longitude'] /= segments['encroachments']
+    segments['start_m'] = segments['segment'] * segment_length
+    segments['end_m'] = segments['start_m'] + segment_length
+
+    segments = segments.sort_values(
+        ['encroachments', 'critical', 'overlap_area_m2'], ascending=False
+    ).reset_index(drop=True)
+    segments.insert(0, 'rank', np.arange(1, len(segments) + 1))
+
+    return segments
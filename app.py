@@ -21,6 +21,26 @@ from shapely.geometry import Point, LineString
 import numpy as np
 from datetime import datetime
 import json
+import os
+import tempfile
+
+from aggregates import (
+    build_analytics_cube, cell_size_for_zoom, cube_histogram, cube_select,
+    cube_totals, rank_segments, sample_points
+)
+from change_detection import encroachment_transitions, monthly_change_series
+from exporter import EXPORT_FORMATS, export
+from filter_engine import FilterIndex
+from map_layers import (
+    SEVERITY_COLORS, ViewportIndex, add_grid_layer, add_point_layer, viewport_from_map_state
+)
+from neighbourhood import NEIGHBOURHOOD_RADIUS
+from profiling import StageProfiler
+from result_store import ROAD_REGISTRY, ResultStore
+from risk_model import (
+    FEATURE_LABELS, LABEL_FEATURES, build_features, load_model, read_model_info, risk_levels, score
+)
+from severity import SEVERITY_LABELS, classify_severity
 
 # Page configuration
 st.set_page_config(
@@ -59,6 +79,154 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_app_profiler():
+    """Stage timings of this server, shown in the hidden diagnostics panel"""
+    return StageProfiler()
+
+# Precomputed results written by batch_analysis.py
+RESULTS_DIR = 'results'
+
+@st.cache_resource
+def load_road_results(road_id, version):
+    """Memory-map a road's stored results in the compact schema; cached until a new version is written"""
+    with get_app_profiler().stage('load_road_results') as record:
+        results = ResultStore(RESULTS_DIR).load_results(road_id)
+        record['rows'] = len(results)
+    return results
+
+@st.cache_resource
+def load_road_aggregates(road_id, version):
+    """Grid aggregates of a road's stored results, cached per version"""
+    with get_app_profiler().stage('load_road_aggregates'):
+        return ResultStore(RESULTS_DIR).load_aggregates(road_id)
+
+@st.cache_resource
+def load_road_cube(road_id, version):
+    """Analytics cube of a road's stored results, built on the fly for older versions"""
+    with get_app_profiler().stage('load_road_cube') as record:
+        cube = ResultStore(RESULTS_DIR).load_cube(road_id)
+        if cube is None:
+            cube = build_analytics_cube(load_road_results(road_id, version))
+        record['rows'] = len(cube)
+    return cube
+
+# Trained risk model written by risk_model.py
+MODELS_DIR = 'models'
+
+@st.cache_resource
+def load_risk_model(model_version):
+    """Risk model artifact, loaded once per trained version"""
+    return load_model(MODELS_DIR)[0]
+
+@st.cache_resource
+def score_road(road_id, version, model_version):
+    """Encroachment probability of every stored building on a road, scored in one batch"""
+    results = load_road_results(road_id, version)
+    with get_app_profiler().stage('score_road', rows=len(results)):
+        features = build_features(
+            results, cache_path=ResultStore(RESULTS_DIR).feature_cache_path(road_id)
+        )
+        return score(load_risk_model(model_version), features)
+
+@st.cache_resource
+def load_change_series(road_id, version):
+    """Monthly new/resolved/persisting encroachments from a road's snapshots"""
+    with get_app_profiler().stage('load_change_series') as record:
+        snapshots = ResultStore(RESULTS_DIR).load_snapshots(road_id)
+        record['rows'] = len(snapshots)
+        return monthly_change_series(encroachment_transitions(snapshots))
+
+@st.cache_resource
+def load_segment_ranking(road_id, version):
+    """Chainage segments of a road ranked by encroachments; empty for results stored before chainage"""
+    results = load_road_results(road_id, version)
+    if 'segment' not in results:
+        return rank_segments(pd.DataFrame(columns=[
+            'road_name', 'segment', 'is_encroachment', 'severity', 'latitude', 'longitude'
+        ]))
+    entry = ResultStore(RESULTS_DIR).get_entry(road_id)
+    with get_app_profiler().stage('rank_segments', rows=len(results)):
+        return rank_segments(results, entry.get('segment_length') or 100)
+
+def histogram_figure(histogram, title, x_label, color):
+    """Bar chart of a cube histogram, one bar per bin"""
+    widths = np.diff(histogram['start']).tolist()
+    widths.append(widths[-1] if widths else 1)
+    fig = go.Figure(go.Bar(
+        x=histogram['start'] + np.array(widths) / 2,
+        y=histogram['count'],
+        width=widths,
+        marker_color=color
+    ))
+    fig.update_layout(title=title, xaxis_title=x_label, yaxis_title="Number of Buildings",
+                      bargap=0)
+    return fig
+
+SEVERITY_RANK = {label: rank for rank, label in enumerate(SEVERITY_LABELS)}
+
+@st.cache_resource
+def get_viewport_index(dataset_key, _df):
+    """Spatial index over a dataset's map points, built once per dataset"""
+    priority = _df['severity'].astype(str).map(SEVERITY_RANK).fillna(4).to_numpy()
+    return ViewportIndex(_df['latitude'], _df['longitude'], priority=priority)
+
+@st.cache_resource
+def get_filter_index(dataset_key, _df):
+    """Bitmap index over a dataset's sidebar filter columns, built once per dataset"""
+    return FilterIndex(_df, ['severity', 'building_type'])
+
+def summarize_cube(cube):
+    """Headline metrics of a cube selection"""
+    totals = cube_totals(cube)
+    buildings = int(totals.get('buildings', 0))
+    return {
+        'count': int(totals.get('encroachments', 0)),
+        'critical': int(cube.loc[cube['severity'] == 'Critical', 'buildings'].sum()),
+        'avg_depth': totals['value_sum'] / buildings if buildings else float('nan'),
+        'total_area': totals.get('area_m2', 0.0)
+    }
+
+def download_on_demand(label, key, data, fmt, file_stem, signature, **columns):
+    """
+    Download button whose file is only written once the user asks for it
+    
+    The export is streamed to a temporary file and kept for as long as
+    ``signature`` (e.g. the active filters) stays the same.
+    """
+    extension, mime = EXPORT_FORMATS[fmt]
+    prepared = st.session_state.get(key)
+    
+    if prepared is not None and prepared['signature'] != signature:
+        os.remove(prepared['path'])
+        prepared = st.session_state[key] = None
+    
+    if prepared is None:
+        if st.button(f"Prepare {label}", key=f"{key}_prepare"):
+            fd, path = tempfile.mkstemp(suffix=extension)
+            os.close(fd)
+            export(data, path, fmt=fmt, **columns)
+            prepared = st.session_state[key] = {'path': path, 'signature': signature}
+    
+    if prepared is not None:
+        with open(prepared['path'], 'rb') as f:
+            st.download_button(
+                label=f"📥 Download {label}",
+                data=f,
+                file_name=f"{file_stem}{extension}",
+                mime=mime,
+                key=f"{key}_download"
+            )
+
+def map_view(map_key, default_center, default_zoom):
+    """Bounds, center and zoom the user last left a map at"""
+    state = st.session_state.get(map_key)
+    bounds, zoom = viewport_from_map_state(state)
+    center = (state or {}).get('center') or {}
+    if center.get('lat') is not None:
+        default_center = [center['lat'], center['lng']]
+    return bounds, default_center, zoom or default_zoom
+
 # Initialize session state
 if 'data_loaded' not in st.session_state:
     st.session_state.data_loaded = False
@@ -73,16 +241,12 @@ with st.sidebar:
     st.markdown("---")
     st.markdown("### 📍 Select Road")
     
-    # Major roads in Nairobi with IDs
+    # Major roads in Nairobi with IDs; a road is analyzed once the batch
+    # runner has written its results to the store
+    result_store = ResultStore(RESULTS_DIR)
     roads_data = {
-        "Outer Ring Road": {"id": "ORR-001", "analyzed": True},
-        "Thika Road": {"id": "THK-002", "analyzed": False},
-        "Mombasa Road": {"id": "MOM-003", "analyzed": False},
-        "Waiyaki Way": {"id": "WAY-004", "analyzed": False},
-        "Uhuru Highway": {"id": "UHU-005", "analyzed": False},
-        "Jogoo Road": {"id": "JOG-006", "analyzed": False},
-        "Ngong Road": {"id": "NGO-007", "analyzed": False},
-        "Kiambu Road": {"id": "KIA-008", "analyzed": False}
+        name: {"id": info["id"], "analyzed": result_store.has_road(info["id"])}
+        for name, info in ROAD_REGISTRY.items()
     }
     
     selected_road = st.selectbox(
@@ -117,6 +281,12 @@ with st.sidebar:
     st.markdown("**Data Source:** OpenStreetMap")
     st.markdown("**Last Updated:** " + datetime.now().strftime("%Y-%m-%d"))
 
+# Stored results for the selected road
+if road_info['analyzed']:
+    road_entry = result_store.get_entry(road_info['id'])
+    results_df = load_road_results(road_info['id'], road_entry['version'])
+    road_cube = load_road_cube(road_info['id'], road_entry['version'])
+
 # Main content
 st.title("🏙️ Nairobi Road Reserve Encroachment Mapping System")
 st.markdown(f"### Currently Viewing: **{selected_road}**")
@@ -128,36 +298,52 @@ with tab1:
     st.header("Interactive Encroachment Map")
     
     if road_info['analyzed']:
+        total_buildings = road_entry['total_buildings']
+        total_encroachments = road_entry['total_encroachments']
+        rate = total_encroachments / total_buildings * 100 if total_buildings else 0
+        
+        # Deltas against the previous stored version, when there is one
+        previous = road_entry.get('previous')
+        if previous:
+            previous_rate = (
+                previous['total_encroachments'] / previous['total_buildings'] * 100
+                if previous['total_buildings'] else 0
+            )
+            buildings_delta = f"{total_buildings - previous['total_buildings']:+,}"
+            encroachments_delta = f"{total_encroachments - previous['total_encroachments']:+,}"
+            rate_delta = f"{rate - previous_rate:+.1f}%"
+        else:
+            buildings_delta = encroachments_delta = rate_delta = None
+        
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
             st.metric(
                 label="Total Buildings",
-                value="1,247",
-                delta="12 new"
+                value=f"{total_buildings:,}",
+                delta=buildings_delta
             )
         
         with col2:
             st.metric(
                 label="Encroachments Detected",
-                value="342",
-                delta="-5 resolved",
+                value=f"{total_encroachments:,}",
+                delta=encroachments_delta,
                 delta_color="inverse"
             )
         
         with col3:
             st.metric(
                 label="Encroachment Rate",
-                value="27.4%",
-                delta="-2.1%",
+                value=f"{rate:.1f}%",
+                delta=rate_delta,
                 delta_color="inverse"
             )
         
         with col4:
             st.metric(
                 label="Road Length (km)",
-                value="32.5",
-                delta="0"
+                value=f"{road_entry.get('road_length_km', 0):.1f}"
             )
         
         st.markdown("---")
@@ -172,11 +358,20 @@ with tab1:
         with col3:
             show_buffer = st.checkbox("Show Road Buffer Zone", value=True)
         
+        # Only the buildings in the current view are sent to the browser
+        map_key = f"road_map_{road_info['id']}"
+        bounds, center, zoom = map_view(
+            map_key,
+            [results_df['latitude'].mean(), results_df['longitude'].mean()],
+            13
+        )
+        
         # Create the map
         m = folium.Map(
-            location=[-1.2921, 36.8219],  # Nairobi coordinates
-            zoom_start=13,
-            tiles='OpenStreetMap'
+            location=center,
+            zoom_start=zoom,
+            tiles='OpenStreetMap',
+            prefer_canvas=True
         )
         
         # Add road network layer
@@ -208,56 +403,44 @@ with tab1:
                 popup='30m Road Reserve'
             ).add_to(m)
         
-        # Add sample building markers
-        if show_buildings or show_encroachments:
-            # Sample encroachment points
-            encroachment_points = [
-                (-1.2921, 36.8219, "Building A", 15, "Residential"),
-                (-1.2870, 36.8280, "Building B", 8, "Commercial"),
-                (-1.2820, 36.8340, "Building C", 22, "Residential"),
-                (-1.2780, 36.8380, "Building D", 5, "Mixed-Use"),
-                (-1.2730, 36.8430, "Building E", 18, "Commercial")
-            ]
+        # Zoomed out: one choropleth cell per grid square from the stored
+        # aggregates; zoomed in: individual building markers
+        cell_size = cell_size_for_zoom(zoom)
+        aggregates = (
+            load_road_aggregates(road_info['id'], road_entry['version'])
+            if 'aggregates_path' in road_entry else None
+        )
+        
+        if cell_size is not None and aggregates is not None:
+            cells = aggregates[aggregates['cell_size'] == cell_size]
+            if bounds is not None:
+                south, west, north, east = bounds
+                cells = cells.cx[west:east, south:north]
+            add_grid_layer(m, cells)
+        
+        # Add building markers for the current viewport
+        elif show_buildings or show_encroachments:
+            is_encroachment = results_df['is_encroachment'].to_numpy()
+            visible = (is_encroachment & show_encroachments) | (~is_encroachment & show_buildings)
             
-            for lat, lon, name, distance, bld_type in encroachment_points:
-                if show_encroachments:
-                    folium.CircleMarker(
-                        location=[lat, lon],
-                        radius=8,
-                        popup=f"""
-                        <b>{name}</b><br>
-                        Distance: {distance}m from road<br>
-                        Type: {bld_type}<br>
-                        Status: <span style='color: red;'>Encroachment</span>
-                        """,
-                        color='red',
-                        fill=True,
-                        fillColor='red',
-                        fillOpacity=0.7
-                    ).add_to(m)
+            viewport_index = get_viewport_index(
+                f"{road_info['id']}-v{road_entry['version']}", results_df
+            )
+            in_view = results_df.iloc[viewport_index.query(bounds, zoom, mask=visible)]
+            in_view = in_view.assign(
+                status=np.where(in_view['is_encroachment'], 'Encroachment', 'Compliant'),
+                distance_m=in_view['distance_meters']
+            )
             
-            # Sample non-encroaching buildings
-            if show_buildings:
-                normal_points = [
-                    (-1.2900, 36.8240, "Building F", 35),
-                    (-1.2840, 36.8320, "Building G", 42),
-                    (-1.2760, 36.8410, "Building H", 38)
-                ]
-                
-                for lat, lon, name, distance in normal_points:
-                    folium.CircleMarker(
-                        location=[lat, lon],
-                        radius=6,
-                        popup=f"""
-                        <b>{name}</b><br>
-                        Distance: {distance}m from road<br>
-                        Status: <span style='color: green;'>Compliant</span>
-                        """,
-                        color='green',
-                        fill=True,
-                        fillColor='green',
-                        fillOpacity=0.5
-                    ).add_to(m)
+            add_point_layer(
+                m,
+                in_view,
+                color_column='status',
+                colors={'Encroachment': 'red', 'Compliant': 'green'},
+                popup_fields=['status', 'severity', 'distance_m', 'building'],
+                popup_aliases=['Status', 'Severity', 'Distance (m)', 'Type'],
+                radius=6
+            )
         
         # Add legend
         legend_html = '''
@@ -274,13 +457,23 @@ with tab1:
         '''
         m.get_root().html.add_child(folium.Element(legend_html))
         
-        # Display the map
-        st_folium(m, width=1400, height=600)
+        # Display the map; panning or zooming reruns with the new viewport
+        with get_app_profiler().stage('render_map'):
+            st_folium(
+                m,
+                key=map_key,
+                center=center,
+                zoom=zoom,
+                width=1400,
+                height=600,
+                returned_objects=['bounds', 'center', 'zoom']
+            )
         
-        st.info("💡 **Tip:** Click on markers to view building details. Zoom in/out to explore different areas.")
+        st.info("💡 **Tip:** Zoom in to switch from the density grid to individual buildings, then click on markers to view building details.")
         
     else:
-        st.warning(f"⚠️ Encroachment analysis for {selected_road} is not yet available. Currently, only Outer Ring Road has been analyzed.")
+        st.warning(f"⚠️ Encroachment analysis for {selected_road} is not yet available.")
+        st.code(f'python batch_analysis.py "{selected_road}"', language="bash")
         st.info("📍 The interactive map will be available once the analysis is completed.")
 
 with tab2:
@@ -293,33 +486,27 @@ with tab2:
         col1, col2 = st.columns(2)
         
         with col1:
-            # Distance distribution
-            distances = np.random.normal(20, 10, 342)
-            distances = distances[distances > 0]
+            # Distance distribution, pre-binned in the analytics cube
+            threshold = road_entry.get('threshold', 30)
             
-            fig = px.histogram(
-                x=distances,
-                nbins=30,
-                title="Distribution of Building Distances from Road",
-                labels={'x': 'Distance from Road (meters)', 'y': 'Number of Buildings'},
-                color_discrete_sequence=['#FF6B6B']
+            fig = histogram_figure(
+                cube_histogram(road_cube),
+                "Distribution of Building Distances from Road",
+                "Distance from Road (meters)",
+                '#FF6B6B'
             )
-            fig.add_vline(x=30, line_dash="dash", line_color="green", 
-                         annotation_text="Legal Limit (30m)")
+            fig.add_vline(x=threshold, line_dash="dash", line_color="green", 
+                         annotation_text=f"Legal Limit ({threshold:g}m)")
             st.plotly_chart(fig, use_container_width=True)
         
         with col2:
-            # Building type distribution
-            building_types = {
-                'Residential': 198,
-                'Commercial': 89,
-                'Mixed-Use': 38,
-                'Industrial': 17
-            }
+            # Building type distribution from the OSM building tag
+            building_types = cube_totals(road_cube, 'building_type')['encroachments']
+            building_types = building_types[building_types > 0].sort_values(ascending=False)
             
             fig = px.pie(
-                values=list(building_types.values()),
-                names=list(building_types.keys()),
+                values=building_types.values,
+                names=building_types.index,
                 title="Encroaching Buildings by Type",
                 color_discrete_sequence=px.colors.sequential.RdBu
             )
@@ -333,13 +520,17 @@ with tab2:
         col1, col2 = st.columns(2)
         
         with col1:
-            severity_data = {
-                'Severity': ['Critical (<10m)', 'High (10-20m)', 'Moderate (20-30m)'],
-                'Count': [87, 142, 113],
-                'Percentage': [25.4, 41.5, 33.1]
-            }
+            severity_counts = (
+                cube_totals(road_cube, 'severity')['encroachments']
+                .reindex(['Critical', 'High', 'Moderate'], fill_value=0)
+                .astype(int)
+            )
             
-            df_severity = pd.DataFrame(severity_data)
+            df_severity = pd.DataFrame({
+                'Severity': severity_counts.index,
+                'Count': severity_counts.values,
+                'Percentage': (severity_counts.values / max(severity_counts.sum(), 1) * 100).round(1)
+            })
             
             fig = px.bar(
                 df_severity,
@@ -353,108 +544,159 @@ with tab2:
             st.plotly_chart(fig, use_container_width=True)
         
         with col2:
-            # Timeline data
-            months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun']
-            new_encroachments = [12, 8, 15, 10, 7, 5]
-            resolved = [3, 5, 2, 8, 6, 9]
+            # Changes between the stored dated snapshots
+            change_series = load_change_series(road_info['id'], road_entry['version'])
             
-            fig = go.Figure()
-            fig.add_trace(go.Scatter(x=months, y=new_encroachments, 
-                                    mode='lines+markers', name='New Encroachments',
-                                    line=dict(color='red', width=3)))
-            fig.add_trace(go.Scatter(x=months, y=resolved, 
-                                    mode='lines+markers', name='Resolved',
-                                    line=dict(color='green', width=3)))
-            
-            fig.update_layout(title="Encroachment Trends (2024)",
-                            xaxis_title="Month",
-                            yaxis_title="Count")
-            st.plotly_chart(fig, use_container_width=True)
+            if len(change_series) > 0:
+                months = change_series.index.tolist()
+                
+                fig = go.Figure()
+                fig.add_trace(go.Scatter(x=months, y=change_series['new'], 
+                                        mode='lines+markers', name='New Encroachments',
+                                        line=dict(color='red', width=3)))
+                fig.add_trace(go.Scatter(x=months, y=change_series['resolved'], 
+                                        mode='lines+markers', name='Resolved',
+                                        line=dict(color='green', width=3)))
+                fig.add_trace(go.Scatter(x=months, y=change_series['persisting'], 
+                                        mode='lines', name='Persisting',
+                                        line=dict(color='gray', width=2, dash='dot')))
+                
+                fig.update_layout(title="Encroachment Trends",
+                                xaxis_title="Month",
+                                yaxis_title="Count")
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("Encroachment trends appear once this road has been analysed on two or more dates.")
         
         st.markdown("---")
         
-        # Spatial patterns
+        # Spatial patterns along the road, by fixed-length chainage segment
         st.subheader("📍 Spatial Pattern Analysis")
         
+        segments = load_segment_ranking(road_info['id'], road_entry['version'])
+        segment_length = road_entry.get('segment_length') or 100
+        
         col1, col2, col3 = st.columns(3)
         
         with col1:
-            st.markdown("""
+            hotspots = "".join(
+                f"<li>{row.road_name} km {row.start_m / 1000:.1f}–{row.end_m / 1000:.1f}: "
+                f"{row.encroachments} cases</li>"
+                for row in segments.head(3).itertuples()
+            )
+            st.markdown(f"""
             <div class="metric-card">
-                <h3>Hotspot Areas</h3>
-                <p><b>3</b> major clusters identified</p>
-                <ul>
-                    <li>Eastlands Section: 127 cases</li>
-                    <li>Parklands Area: 98 cases</li>
-                    <li>South C Section: 117 cases</li>
-                </ul>
+                <h3>Hotspot Segments</h3>
+                <p><b>{len(segments)}</b> of the {segment_length:g} m segments have encroachments</p>
+                <ul>{hotspots}</ul>
             </div>
             """, unsafe_allow_html=True)
         
         with col2:
-            st.markdown("""
+            encroaching_cells = cube_totals(cube_select(road_cube, severity=['Critical', 'High', 'Moderate']))
+            average_distance = (
+                encroaching_cells['value_sum'] / encroaching_cells['buildings']
+                if encroaching_cells['buildings'] else 0
+            )
+            st.markdown(f"""
             <div class="metric-card">
                 <h3>Average Encroachment</h3>
-                <p><b>18.6 meters</b> from road edge</p>
+                <p><b>{average_distance:.1f} meters</b> from road centerline</p>
                 <p>Within road reserve zone</p>
-                <p style="color: red;"><b>11.4m</b> below legal limit</p>
+                <p style="color: red;"><b>{max(threshold - average_distance, 0):.1f}m</b> below legal limit</p>
             </div>
             """, unsafe_allow_html=True)
         
         with col3:
-            st.markdown("""
+            st.markdown(f"""
             <div class="metric-card">
                 <h3>Risk Assessment</h3>
-                <p><b>High Risk:</b> 87 buildings</p>
-                <p><b>Medium Risk:</b> 142 buildings</p>
-                <p><b>Low Risk:</b> 113 buildings</p>
+                <p><b>Critical:</b> {severity_counts['Critical']:,} buildings</p>
+                <p><b>High:</b> {severity_counts['High']:,} buildings</p>
+                <p><b>Moderate:</b> {severity_counts['Moderate']:,} buildings</p>
             </div>
             """, unsafe_allow_html=True)
         
+        # Ranked list for field crews
+        if len(segments) > 0:
+            st.markdown("#### 🚧 Segments to Survey")
+            st.dataframe(
+                segments[['rank', 'road_name', 'start_m', 'end_m', 'encroachments',
+                          'critical', 'high', 'moderate', 'buildings', 'latitude', 'longitude']]
+                .rename(columns={
+                    'rank': 'Rank', 'road_name': 'Road', 'start_m': 'From (m)',
+                    'end_m': 'To (m)', 'encroachments': 'Encroachments',
+                    'critical': 'Critical', 'high': 'High', 'moderate': 'Moderate',
+                    'buildings': 'Buildings', 'latitude': 'Latitude', 'longitude': 'Longitude'
+                }),
+                use_container_width=True,
+                height=300,
+                hide_index=True
+            )
+        
     else:
         st.warning(f"⚠️ Statistical analysis for {selected_road} is not yet available.")
 
 with tab3:
     st.header("Machine Learning Model")
     
-    if road_info['analyzed']:
+    model_info = read_model_info(MODELS_DIR)
+    # Models trained on the inputs of the encroachment rule only relearn it
+    outdated_model = model_info is not None and any(
+        feature in LABEL_FEATURES for feature in model_info['features']
+    )
+    
+    if road_info['analyzed'] and model_info is not None and not outdated_model:
+        risk_model = load_risk_model(model_info['version'])
+        model_metrics = model_info['metrics']
+        
         st.subheader("🤖 Encroachment Prediction Model")
         
+        st.caption(
+            "Encroachment is defined by distance from the road and the reserve width of "
+            "its road class, so the model is not given those: it rates how closely a "
+            "building's footprint and surroundings resemble those of encroaching buildings."
+        )
+        
         col1, col2 = st.columns([1, 1])
         
         with col1:
-            st.markdown("""
+            features_list = "\n".join(
+                f"            - {FEATURE_LABELS.get(feature, feature)}"
+                for feature in model_info['features']
+            )
+            n_total = model_info['n_train'] + model_info['n_test']
+            st.markdown(f"""
             ### Model Information
             
-            **Algorithm:** Random Forest Classifier
+            **Algorithm:** Random Forest Classifier (version {model_info['version']}, 
+            trained {model_info['created'][:10]})
             
             **Features Used:**
-            - Distance from road centerline
-            - Building area (m²)
-            - Building type
-            - Land use category
-            - Proximity to amenities
-            - Historical encroachment data
+{features_list}
             
             **Training Data:**
-            - Total samples: 1,247 buildings
-            - Training set: 80% (998 buildings)
-            - Test set: 20% (249 buildings)
+            - Total samples: {n_total:,} buildings
+            - Training set: {model_info['n_train']:,} buildings
+            - Test set: {model_info['n_test']:,} buildings
             """)
         
         with col2:
-            st.markdown("""
+            roc_auc = model_metrics.get('roc_auc')
+            st.markdown(f"""
             ### Model Performance
             
-            **Accuracy:** 94.3%
+            *Measured on the held-out test set*
+            
+            **Accuracy:** {model_metrics['accuracy']:.1%}
             
-            **Precision:** 92.1%
+            **Precision:** {model_metrics['precision']:.1%}
             
-            **Recall:** 89.7%
+            **Recall:** {model_metrics['recall']:.1%}
             
-            **F1-Score:** 90.9%
+            **F1-Score:** {model_metrics['f1']:.1%}
             
-            **AUC-ROC:** 0.96
+            **AUC-ROC:** {f"{roc_auc:.2f}" if roc_auc is not None else 'n/a'}
             """)
         
         st.markdown("---")
@@ -465,10 +707,8 @@ with tab3:
         with col1:
             st.subheader("Confusion Matrix")
             
-            confusion_matrix = [[223, 12], [14, 186]]
-            
             fig = px.imshow(
-                confusion_matrix,
+                model_info['confusion_matrix'],
                 labels=dict(x="Predicted", y="Actual", color="Count"),
                 x=['Non-Encroachment', 'Encroachment'],
                 y=['Non-Encroachment', 'Encroachment'],
@@ -481,9 +721,9 @@ with tab3:
         with col2:
             st.subheader("Feature Importance")
             
-            features = ['Distance from Road', 'Building Area', 'Building Type', 
-                       'Land Use', 'Proximity Score', 'Historical Data']
-            importance = [0.35, 0.25, 0.15, 0.12, 0.08, 0.05]
+            importances = model_info['feature_importances']
+            features = [FEATURE_LABELS.get(feature, feature) for feature in importances]
+            importance = list(importances.values())
             
             fig = px.bar(
                 x=importance,
@@ -498,37 +738,71 @@ with tab3:
         
         st.markdown("---")
         
+        # Every building on the road scored in one batch
+        st.subheader("📊 Risk Scores for All Buildings")
+        
+        probability = score_road(road_info['id'], road_entry['version'], model_info['version'])
+        levels = pd.Series(risk_levels(probability))
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            level_counts = levels.value_counts().reindex(['HIGH', 'MODERATE', 'LOW'], fill_value=0)
+            fig = px.bar(
+                x=level_counts.index,
+                y=level_counts.values,
+                title="Buildings by Predicted Risk Level",
+                labels={'x': 'Risk Level', 'y': 'Buildings'},
+                color=level_counts.index,
+                color_discrete_map={'HIGH': 'red', 'MODERATE': 'orange', 'LOW': 'green'}
+            )
+            st.plotly_chart(fig, use_container_width=True)
+        
+        with col2:
+            # Compliant buildings that look like encroachers are worth a survey
+            at_risk = ~results_df['is_encroachment'].to_numpy() & (probability >= 0.3)
+            watch_columns = [
+                column for column in ('osmid', 'building', 'distance_meters', 'latitude', 'longitude')
+                if column in results_df
+            ]
+            watch = (
+                results_df.loc[at_risk, watch_columns]
+                .assign(probability=probability[at_risk])
+                .sort_values('probability', ascending=False)
+            )
+            
+            st.markdown(f"**{len(watch):,}** compliant buildings with elevated predicted risk")
+            st.dataframe(watch.head(100), use_container_width=True, height=350)
+        
+        st.markdown("---")
+        
         # Prediction tool
         st.subheader("🔮 Encroachment Prediction Tool")
         
         st.markdown("Enter building parameters to predict encroachment probability:")
         
-        col1, col2, col3 = st.columns(3)
+        col1, col2 = st.columns(2)
         
         with col1:
-            distance = st.slider("Distance from Road (m)", 0, 50, 20)
-            building_area = st.number_input("Building Area (m²)", 50, 1000, 200)
+            building_area = st.number_input("Building Area (m²)", 10, 5000, 200)
+            building_type = st.selectbox("Building Type", model_info['categories']['building_type'])
         
         with col2:
-            building_type = st.selectbox("Building Type", 
-                                        ["Residential", "Commercial", "Mixed-Use", "Industrial"])
-            land_use = st.selectbox("Land Use", 
-                                   ["Urban", "Suburban", "Rural"])
-        
-        with col3:
-            proximity = st.slider("Proximity to Amenities (0-10)", 0, 10, 5)
-            historical = st.selectbox("Historical Encroachment", ["Yes", "No"])
+            neighbours = st.slider(f"Buildings within {NEIGHBOURHOOD_RADIUS} m", 0, 100, 10)
+            local_rate = st.slider("Share of Those Encroaching (%)", 0, 100, 20)
+            nearest_encroacher = st.slider("Distance to Nearest Encroacher (m)", 0, 500, 100)
         
         if st.button("Predict Encroachment Risk", type="primary"):
-            # Simple prediction logic based on distance
-            if distance < 30:
-                probability = min(95, (30 - distance) / 30 * 100)
-                risk_level = "HIGH" if probability > 70 else "MODERATE"
-                color = "red" if probability > 70 else "orange"
-            else:
-                probability = max(5, 100 - (distance - 30) * 2)
-                risk_level = "LOW"
-                color = "green"
+            single = pd.DataFrame({
+                'area_m2': [float(building_area)],
+                'neighbour_count': [float(neighbours)],
+                'local_encroachment_rate': [local_rate / 100],
+                'nearest_encroacher_m': [float(nearest_encroacher)],
+                'building_type': [building_type]
+            })
+            probability = float(score(risk_model, single)[0]) * 100
+            risk_level = risk_levels([probability / 100])[0]
+            color = {'HIGH': 'red', 'MODERATE': 'orange', 'LOW': 'green'}[risk_level]
             
             col1, col2, col3 = st.columns(3)
             
@@ -542,11 +816,20 @@ with tab3:
             st.markdown(f"""
             <div style="background-color: {color}; padding: 15px; border-radius: 5px; color: white; margin-top: 20px;">
                 <h4>Prediction Result</h4>
-                <p>Based on the provided parameters, this building has a <b>{probability:.1f}%</b> 
+                <p>A building with this footprint and surroundings has a <b>{probability:.1f}%</b> 
                 probability of encroaching on the road reserve. Risk level: <b>{risk_level}</b></p>
             </div>
             """, unsafe_allow_html=True)
     
+    elif road_info['analyzed'] and outdated_model:
+        st.info("The latest model was trained on distance, reserve width and road class, "
+                "which define the encroachment label. Retrain it with "
+                "`python risk_model.py --results results --models models`.")
+    
+    elif road_info['analyzed']:
+        st.info("No trained model yet. Train one from the stored results with "
+                "`python risk_model.py --results results --models models`.")
+    
     else:
         st.warning(f"⚠️ ML model for {selected_road} is not yet available.")
 
@@ -556,20 +839,18 @@ with tab4:
     if road_info['analyzed']:
         st.subheader("📋 Encroachment Records")
         
-        # Sample data
-        sample_data = {
-            'Building ID': [f'BLD-{i:04d}' for i in range(1, 21)],
-            'Building Name': [f'Building {chr(65+i)}' for i in range(20)],
-            'Type': np.random.choice(['Residential', 'Commercial', 'Mixed-Use', 'Industrial'], 20),
-            'Distance (m)': np.random.randint(5, 45, 20),
-            'Area (m²)': np.random.randint(100, 800, 20),
-            'Encroachment': np.random.choice(['Yes', 'No'], 20, p=[0.3, 0.7]),
-            'Risk Level': np.random.choice(['Low', 'Moderate', 'High'], 20, p=[0.4, 0.4, 0.2]),
-            'Latitude': np.random.uniform(-1.30, -1.26, 20),
-            'Longitude': np.random.uniform(36.81, 36.85, 20)
-        }
-        
-        df = pd.DataFrame(sample_data)
+        # Stored results for this road
+        df = pd.DataFrame({
+            'Building ID': results_df['osmid'] if 'osmid' in results_df else results_df.index,
+            'Building Name': results_df['name'] if 'name' in results_df else None,
+            'Type': results_df['building'],
+            'Distance (m)': results_df['distance_meters'].round(1),
+            'Area (m²)': results_df['area_m2'].round(0),
+            'Encroachment': np.where(results_df['is_encroachment'], 'Yes', 'No'),
+            'Risk Level': results_df['severity'].astype(str),
+            'Latitude': results_df['latitude'],
+            'Longitude': results_df['longitude']
+        })
         
         # Filters
         col1, col2, col3 = st.columns(3)
@@ -596,25 +877,28 @@ with tab4:
         
         st.dataframe(filtered_df, use_container_width=True, height=400)
         
-        # Download options
+        # Download options; files are written only when requested
         col1, col2, col3 = st.columns(3)
         
         with col1:
-            csv = filtered_df.to_csv(index=False)
-            st.download_button(
-                label="📥 Download as CSV",
-                data=csv,
-                file_name=f"{selected_road}_encroachment_data.csv",
-                mime="text/csv"
+            export_format = st.selectbox(
+                "Export format",
+                options=list(EXPORT_FORMATS),
+                format_func={'csv': 'CSV', 'geojson': 'GeoJSON',
+                             'parquet': 'GeoParquet', 'fgb': 'FlatGeobuf'}.get
             )
         
         with col2:
-            json_data = filtered_df.to_json(orient='records')
-            st.download_button(
-                label="📥 Download as JSON",
-                data=json_data,
-                file_name=f"{selected_road}_encroachment_data.json",
-                mime="application/json"
+            download_on_demand(
+                export_format.upper(),
+                'explorer_export',
+                filtered_df,
+                export_format,
+                f"{selected_road}_encroachment_data",
+                signature=(road_info['id'], road_entry['version'], export_format,
+                           tuple(filter_type), filter_encroachment, tuple(filter_risk)),
+                lat_column='Latitude',
+                lon_column='Longitude'
             )
         
         with col3:
@@ -623,7 +907,6 @@ with tab4:
     else:
         st.warning(f"⚠️ Data for {selected_road} is not yet available.")
 
-from streamlit_folium import folium_static
 from shapely.geometry import Point, LineString
 import plotly.express as px
 import plotly.graph_objects as go
@@ -683,33 +966,59 @@ def load_sample_data():
     
     df = pd.DataFrame(data)
     
-    # Add severity classification
-    def classify_severity(distance):
-        if distance < 5:
-            return 'Low'
-        elif distance < 15:
-            return 'Moderate'
-        elif distance < 30:
-            return 'High'
-        else:
-            return 'Critical'
+    # Compact columns: categorical codes for labels, float32 metrics
+    df['building_type'] = df['building_type'].astype('category')
+    df['distance_to_road_m'] = df['distance_to_road_m'].astype(np.float32)
     
-    df['severity'] = df['distance_to_road_m'].apply(classify_severity)
+    # Same severity classification as the pipeline, against a 30m reserve
+    df['severity'] = classify_severity(df['distance_to_road_m'], reserve_width=30)
+    df['is_encroachment'] = (df['severity'] != 'Compliant').to_numpy()
     df['encroachment_depth_m'] = np.maximum(0, 50 - df['distance_to_road_m'])
-    df['area_m2'] = df['encroachment_depth_m'] * np.random.uniform(10, 30, n_points)
+    df['area_m2'] = (
+        df['encroachment_depth_m'] * np.random.uniform(10, 30, n_points)
+    ).astype(np.float32)
     
     return df
 
+@st.cache_data
+def load_sample_cube():
+    """Analytics cube of the sample data, built once like the pipeline does"""
+    return build_analytics_cube(
+        load_sample_data(),
+        value_column='encroachment_depth_m',
+        type_column='building_type',
+        date_column='estimated_date'
+    )
+
+@st.cache_data
+def load_sample_snapshots():
+    """Month-end snapshots of the sample data: each building encroaches from its estimated date"""
+    sample = load_sample_data()
+    month_ends = pd.date_range(
+        sample['estimated_date'].min(), sample['estimated_date'].max() + pd.offsets.MonthEnd(0),
+        freq=pd.offsets.MonthEnd()
+    )
+    frames = [
+        pd.DataFrame({
+            'date': month_end,
+            'building_key': sample.loc[sample['estimated_date'] <= month_end, 'id'].to_numpy(dtype=np.uint64),
+            'segment': -1
+        })
+        for month_end in month_ends
+    ]
+    return pd.concat(frames, ignore_index=True)
+
 # Load data
 with st.spinner('Loading data...'):
     df = load_sample_data()
+    sample_cube = load_sample_cube()
 
 # Sidebar filters
 st.sidebar.header("🔍 Filters")
 severity_filter = st.sidebar.multiselect(
     "Severity Level",
-    options=['Critical', 'High', 'Moderate', 'Low'],
-    default=['Critical', 'High', 'Moderate', 'Low']
+    options=list(SEVERITY_LABELS),
+    default=list(SEVERITY_LABELS)
 )
 
 building_filter = st.sidebar.multiselect(
@@ -718,24 +1027,27 @@ building_filter = st.sidebar.multiselect(
     default=df['building_type'].unique()
 )
 
-# Apply filters
-filtered_df = df[
-    (df['severity'].isin(severity_filter)) &
-    (df['building_type'].isin(building_filter))
-]
+# Apply filters through the bitmap index; selection bitmaps are memoised,
+# the rows are materialised per run
+filter_index = get_filter_index('sample', df)
+selection = {'severity': severity_filter, 'building_type': building_filter}
+filter_mask = filter_index.mask(**selection)
+filtered_df = df[filter_mask]
+selected_cube = cube_select(sample_cube, **selection)
+summary = summarize_cube(selected_cube)
 
 # Metrics
 col1, col2, col3, col4 = st.columns(4)
 with col1:
-    st.metric("📍 Total Encroachments", len(filtered_df))
+    st.metric("📍 Total Encroachments", summary['count'])
 with col2:
-    critical = len(filtered_df[filtered_df['severity'] == 'Critical'])
+    critical = summary['critical']
     st.metric("⚠️ Critical Cases", critical)
 with col3:
-    avg_depth = filtered_df['encroachment_depth_m'].mean()
+    avg_depth = summary['avg_depth']
     st.metric("📏 Avg Depth (m)", f"{avg_depth:.1f}")
 with col4:
-    total_area = filtered_df['area_m2'].sum()
+    total_area = summary['total_area']
     st.metric("🏗️ Total Area (m²)", f"{total_area:,.0f}")
 
 # Tabs
@@ -744,45 +1056,43 @@ tab1, tab2, tab3, tab4 = st.tabs(["🗺️ Interactive Map", "📊 Analytics", "
 with tab1:
     st.subheader("Interactive Encroachment Map")
     
-    # Create map
-    center_lat = filtered_df['latitude'].mean()
-    center_lon = filtered_df['longitude'].mean()
+    # Only the filtered buildings in the current view are sent to the browser
+    bounds, center, zoom = map_view(
+        'encroachment_map',
+        [df['latitude'].mean(), df['longitude'].mean()],
+        12
+    )
+    viewport_index = get_viewport_index('sample', df)
+    in_view = df.iloc[viewport_index.query(bounds, zoom, mask=filter_mask)]
     
+    # Create map
     m = folium.Map(
-        location=[center_lat, center_lon],
-        zoom_start=12,
-        tiles='OpenStreetMap'
+        location=center,
+        zoom_start=zoom,
+        tiles='OpenStreetMap',
+        prefer_canvas=True
     )
     
-    # Add markers
-    severity_colors = {
-        'Critical': 'red',
-        'High': 'orange',
-        'Moderate': 'yellow',
-        'Low': 'green'
-    }
-    
-    for idx, row in filtered_df.iterrows():
-        popup_text = f"""
-        <b>ID:</b> {row['id']}<br>
-        <b>Severity:</b> {row['severity']}<br>
-        <b>Distance:</b> {row['distance_to_road_m']:.1f}m<br>
-        <b>Depth:</b> {row['encroachment_depth_m']:.1f}m<br>
-        <b>Type:</b> {row['building_type']}<br>
-        <b>Area:</b> {row['area_m2']:.0f}m²
-        """
-        
-        folium.CircleMarker(
-            location=[row['latitude'], row['longitude']],
-            radius=8,
-            popup=folium.Popup(popup_text, max_width=200),
-            color=severity_colors.get(row['severity'], 'gray'),
-            fill=True,
-            fillColor=severity_colors.get(row['severity'], 'gray'),
-            fillOpacity=0.7
-        ).add_to(m)
+    # Add all markers as one canvas layer; popups are built on click
+    add_point_layer(
+        m,
+        in_view,
+        color_column='severity',
+        colors=SEVERITY_COLORS,
+        popup_fields=['id', 'severity', 'distance_to_road_m', 'encroachment_depth_m',
+                      'building_type', 'area_m2'],
+        popup_aliases=['ID', 'Severity', 'Distance (m)', 'Depth (m)', 'Type', 'Area (m²)']
+    )
     
-    folium_static(m, width=1200, height=600)
+    st_folium(
+        m,
+        key='encroachment_map',
+        center=center,
+        zoom=zoom,
+        width=1200,
+        height=600,
+        returned_objects=['bounds', 'center', 'zoom']
+    )
 
 with tab2:
     st.subheader("Statistical Analysis")
@@ -791,18 +1101,19 @@ with tab2:
     
     with col1:
         # Severity distribution
-        severity_counts = filtered_df['severity'].value_counts()
+        severity_counts = cube_totals(selected_cube, 'severity')['buildings']
         fig1 = px.pie(
             values=severity_counts.values,
             names=severity_counts.index,
             title="Severity Distribution",
             color=severity_counts.index,
-            color_discrete_map={'Critical': '#d62728', 'High': '#ff7f0e', 'Moderate': '#ffbb00', 'Low': '#2ca02c'}
+            color_discrete_map={'Critical': '#d62728', 'High': '#ff7f0e', 'Moderate': '#ffbb00', 'Compliant': '#2ca02c'}
         )
         st.plotly_chart(fig1, use_container_width=True)
         
-        # Building type distribution
-        building_counts = filtered_df['building_type'].value_counts()
+        # Building type distribution; the cube also counts Compliant buildings
+        building_counts = cube_totals(selected_cube, 'building_type')['encroachments']
+        building_counts = building_counts[building_counts > 0].sort_values(ascending=False)
         fig2 = px.bar(
             x=building_counts.index,
             y=building_counts.values,
@@ -813,37 +1124,36 @@ with tab2:
     
     with col2:
         # Encroachment depth histogram
-        fig3 = px.histogram(
-            filtered_df,
-            x='encroachment_depth_m',
-            nbins=20,
-            title="Distribution of Encroachment Depth",
-            labels={'encroachment_depth_m': 'Depth (m)', 'count': 'Frequency'}
+        fig3 = histogram_figure(
+            cube_histogram(selected_cube),
+            "Distribution of Encroachment Depth",
+            "Depth (m)",
+            '#636efa'
         )
         st.plotly_chart(fig3, use_container_width=True)
         
-        # Scatter plot
+        # Scatter plot, downsampled per severity for large selections
         fig4 = px.scatter(
-            filtered_df,
+            sample_points(filtered_df),
             x='distance_to_road_m',
             y='area_m2',
             color='severity',
             size='encroachment_depth_m',
             title="Distance vs Area by Severity",
             labels={'distance_to_road_m': 'Distance to Road (m)', 'area_m2': 'Area (m²)'},
-            color_discrete_map={'Critical': '#d62728', 'High': '#ff7f0e', 'Moderate': '#ffbb00', 'Low': '#2ca02c'}
+            color_discrete_map={'Critical': '#d62728', 'High': '#ff7f0e', 'Moderate': '#ffbb00', 'Compliant': '#2ca02c'}
         )
         st.plotly_chart(fig4, use_container_width=True)
 
 with tab3:
     st.subheader("🔮 Key Insights & Recommendations")
     
-    critical_pct = (critical / len(filtered_df) * 100) if len(filtered_df) > 0 else 0
+    critical_pct = (critical / summary['count'] * 100) if summary['count'] > 0 else 0
     
     st.info(f"""
     **Current Status:**
     - {critical_pct:.1f}% of encroachments are classified as Critical
-    - Most affected building type: {filtered_df['building_type'].mode()[0] if len(filtered_df) > 0 else 'N/A'}
+    - Most affected building type: {building_counts.index[0] if len(building_counts) > 0 else 'N/A'}
     - Average encroachment depth: {avg_depth:.1f} meters
     """)
     
@@ -856,13 +1166,19 @@ with tab3:
     """)
     
     # Timeline
-    if len(filtered_df) > 0:
-        timeline = filtered_df.groupby(filtered_df['estimated_date'].dt.to_period('M')).size()
+    if summary['count'] > 0:
+        # New and resolved cases between monthly snapshots of the filtered buildings
+        snapshots = load_sample_snapshots()
+        selected_ids = df.loc[filter_mask, 'id'].to_numpy(dtype=np.uint64)
+        timeline = monthly_change_series(encroachment_transitions(
+            snapshots[snapshots['building_key'].isin(selected_ids)]
+        ))
         fig_timeline = px.line(
-            x=timeline.index.astype(str),
-            y=timeline.values,
+            timeline.reset_index(),
+            x='month',
+            y=['new', 'resolved'],
             title="Encroachment Trend Over Time",
-            labels={'x': 'Month', 'y': 'New Encroachments'}
+            labels={'month': 'Month', 'value': 'Encroachments', 'variable': 'Change'}
         )
         st.plotly_chart(fig_timeline, use_container_width=True)
 
@@ -873,12 +1189,13 @@ with tab4:
     
     col1, col2 = st.columns(2)
     with col1:
-        csv = filtered_df.to_csv(index=False)
-        st.download_button(
-            label="📄 Download as CSV",
-            data=csv,
-            file_name=f"encroachments_{datetime.now().strftime('%Y%m%d')}.csv",
-            mime="text/csv"
+        download_on_demand(
+            "CSV",
+            'sample_export',
+            filtered_df,
+            'csv',
+            f"encroachments_{datetime.now().strftime('%Y%m%d')}",
+            signature=filter_index.selection_key(**selection)
         )
     
     with col2:
@@ -888,6 +1205,42 @@ with tab4:
     st.dataframe(filtered_df, use_container_width=True, height=400)
 
 
+# Hidden diagnostics panel, opened with ?diagnostics=1 in the URL
+if st.query_params.get('diagnostics') == '1':
+    app_profiler = get_app_profiler()
+    with st.expander("🩺 Diagnostics", expanded=True):
+        st.caption(
+            "Stage timings of this server since it started. Cached data is only "
+            "timed when it is computed, so a stage missing here was served from cache."
+        )
+        if not app_profiler.records:
+            st.info("No stages recorded yet")
+        else:
+            st.dataframe(app_profiler.summary(), use_container_width=True)
+            st.markdown("**Most recent stages**")
+            st.dataframe(
+                app_profiler.to_frame().tail(50).iloc[::-1],
+                use_container_width=True,
+                hide_index=True
+            )
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button(
+                    "Stage timings (JSON)",
+                    data=app_profiler.to_json(),
+                    file_name="stage_timings.json",
+                    mime="application/json"
+                )
+            with col2:
+                st.download_button(
+                    "Stage timings (Prometheus)",
+                    data=app_profiler.to_prometheus(),
+                    file_name="stage_timings.prom",
+                    mime="text/plain"
+                )
+
+
 # Footer
 st.markdown("---")
 st.markdown("""
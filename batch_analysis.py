@@ -0,0 +1,184 @@
+"""
+Batch Analysis
+Analyse several roads in one pass and store per-road results
+
+The network and buildings for the combined extent of all requested roads
+are downloaded once. Every building is matched to its nearest edge among
+the requested roads with one shared spatial index, so each building is
+assigned to exactly one road.
+
+Usage:
+    python batch_analysis.py "Outer Ring Road" "Thika Road" --output results
+    python batch_analysis.py --profile profile.prom
+"""
+
+import argparse
+from datetime import datetime
+
+import numpy as np
+import osmnx as ox
+import shapely
+
+from aggregates import build_analytics_cube, build_grid_aggregates
+from data_loader import EncroachmentDataLoader, feature_keys, features_from_polygon
+from profiling import StageProfiler
+from result_store import ROAD_REGISTRY, ResultStore
+
+
+def _edge_matches(names, road_names):
+    """
+    Name of the requested road each edge belongs to, or None
+    """
+    wanted = set(road_names)
+
+    def match(name):
+        # Simplified osmnx edges can carry several names
+        for candidate in (name if isinstance(name, list) else [name]):
+            if candidate in wanted:
+                return candidate
+        return None
+
+    return names.map(match)
+
+
+def analyze_roads(road_names, city="Nairobi, Kenya", output_dir='results',
+                  threshold=30, mode='distance', reserve_widths=None,
+                  buffer_distance=100, cache=None, snapshot_date=None, profiler=None):
+    """
+    Analyse a list of roads in one pass and write per-road results
+
+    Parameters:
+    -----------
+    road_names : list of str
+        Roads from ROAD_REGISTRY to analyse
+    city : str
+        City used to geocode the roads
+    output_dir : str
+        ResultStore directory receiving the datasets and manifest
+    threshold, mode, reserve_widths :
+        Passed to ``identify_encroachments``
+    buffer_distance : float
+        Only buildings within this many meters of a requested road are kept
+    cache : OSMCache
+        Optional download cache
+    snapshot_date : str or datetime
+        Date recorded for the change-detection snapshots (default: today)
+    profiler : StageProfiler
+        Receives the stage timings of the run (default: a new one, kept on
+        the loader)
+
+    Returns:
+    --------
+    dict mapping road id to the written dataset path
+    """
+    unknown = [name for name in road_names if name not in ROAD_REGISTRY]
+    if unknown:
+        raise ValueError(f"Roads not in registry: {unknown}")
+
+    # Combined extent of all roads, padded so edge buildings are included
+    loader = EncroachmentDataLoader(city=city, cache=cache, profiler=profiler)
+    profiler = loader.profiler
+    extents = ox.geocode_to_gdf([f"{name}, {city}" for name in road_names])
+    extent = extents.to_crs(loader.crs).buffer(buffer_distance).to_crs("EPSG:4326")
+    polygon = shapely.box(*extent.total_bounds)
+    place_name = f"bbox:{','.join(f'{v:.5f}' for v in polygon.bounds)}"
+
+    # One download for the whole extent
+    download_graph = lambda: ox.graph_from_polygon(polygon, network_type='drive')
+    tags = {'building': True}
+    download_buildings = lambda: features_from_polygon(polygon, tags)
+    with profiler.stage('download_roads'):
+        if cache is not None:
+            G = cache.get_graph(place_name, 'drive', download_graph)
+        else:
+            G = download_graph()
+    with profiler.stage('download_buildings') as record:
+        if cache is not None:
+            buildings = cache.get_geometries(place_name, tags, download_buildings)
+        else:
+            buildings = download_buildings()
+        record['rows'] = len(buildings)
+
+    with profiler.stage('graph_to_gdfs', rows=G.number_of_edges()):
+        edges = ox.graph_to_gdfs(G, nodes=False, edges=True)
+    road_of_edge = _edge_matches(edges['name'], road_names)
+    edges = edges[road_of_edge.notna()]
+    road_of_edge = road_of_edge[road_of_edge.notna()].to_numpy()
+
+    # Shared index over the requested roads only
+    loader.road_gdf = edges
+    loader.buildings_gdf = buildings
+    loader.project_data()
+    with profiler.stage('buffer_filter', rows=len(buildings)):
+        near = loader.road_index.within(loader.buildings_proj.values, buffer_distance)
+        loader.buildings_gdf = buildings[near]
+        loader.buildings_proj = loader.buildings_proj[near]
+
+    loader.graph = G
+    loader.calculate_distances()
+    loader.identify_encroachments(
+        threshold=threshold, mode=mode, reserve_widths=reserve_widths
+    )
+    loader.calculate_chainage(road_names=road_of_edge)
+    results = loader.get_result_table()
+
+    # Split by the road of each building's nearest edge; buildings without
+    # a matched edge (-1) belong to no road and are not written
+    nearest_edge = results['nearest_edge'].to_numpy()
+    matched = nearest_edge >= 0
+    nearest_road = np.full(len(results), None, dtype=object)
+    nearest_road[matched] = road_of_edge[nearest_edge[matched]]
+    edge_length_km = loader.road_proj.length.to_numpy() / 1000
+
+    store = ResultStore(output_dir)
+    edge_table = loader.get_edge_table()
+    written = {}
+    for name in road_names:
+        road_id = ROAD_REGISTRY[name]['id']
+        road_results = results[nearest_road == name]
+        with profiler.stage('write_road', rows=len(road_results)):
+            encroaching = road_results['is_encroachment'].to_numpy(dtype=bool)
+            store.write_snapshot(
+                road_id,
+                snapshot_date or datetime.now(),
+                feature_keys(road_results)[encroaching],
+                road_results['segment'].to_numpy()[encroaching],
+                road_results['road_name'].to_numpy()[encroaching]
+            )
+            written[road_id] = store.write_road(
+                road_id, name, road_results,
+                aggregates=build_grid_aggregates(road_results, crs=loader.crs),
+                cube=build_analytics_cube(road_results),
+                edges=edge_table,
+                segment_length=loader.segment_length,
+                road_length_km=float(edge_length_km[road_of_edge == name].sum()),
+                **loader.encroachment_settings
+            )
+
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch road encroachment analysis")
+    parser.add_argument('roads', nargs='*', default=list(ROAD_REGISTRY))
+    parser.add_argument('--city', default="Nairobi, Kenya")
+    parser.add_argument('--output', default='results')
+    parser.add_argument('--threshold', type=float, default=30)
+    parser.add_argument('--date', help="Snapshot date of the OSM data (default: today)")
+    parser.add_argument('--profile',
+                        help="Write stage timings here; Prometheus text if it ends in .prom, else JSON")
+    args = parser.parse_args()
+
+    profiler = StageProfiler()
+    for road_id, path in analyze_roads(
+        args.roads, city=args.city, output_dir=args.output, threshold=args.threshold,
+        snapshot_date=args.date, profiler=profiler
+    ).items():
+        print(f"{road_id}: {path}")
+
+    if args.profile:
+        if args.profile.endswith('.prom'):
+            with open(args.profile, 'w') as f:
+                f.write(profiler.to_prometheus())
+        else:
+            profiler.to_json(args.profile)
@@ -0,0 +1,249 @@
+"""
+Benchmarks
+Time each pipeline stage on synthetic cities of increasing size
+
+Every stage from loading to map rendering is timed on cities generated by
+``create_synthetic_city``, reporting throughput and the process's peak
+resident memory as JSON. Runs offline, so no Overpass access is needed.
+A second mode measures how the distance pass scales with worker processes.
+
+Usage:
+    python benchmark.py pipeline --sizes 10000 100000 1000000
+    python benchmark.py parallel --buildings 400000 --workers 1 2 4 8 16
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import geopandas as gpd
+
+from data_loader import EncroachmentDataLoader, create_synthetic_city
+from profiling import peak_rss_mb
+
+
+PIPELINE_STAGES = ('load', 'project', 'distance', 'classify', 'export', 'render')
+
+
+def render_map(results, zoom=16):
+    """
+    Build and serialise the building map the app draws for a full view
+
+    Parameters:
+    -----------
+    results : DataFrame
+        Result table with latitude/longitude, severity and is_encroachment
+    zoom : int
+        Zoom level the viewport is thinned at
+
+    Returns:
+    --------
+    (HTML text, number of points drawn)
+    """
+    import folium
+    from map_layers import ViewportIndex, add_point_layer
+
+    priority = results['severity'].cat.codes.to_numpy()
+    index = ViewportIndex(results['latitude'], results['longitude'], priority=priority)
+    in_view = results.iloc[index.query(zoom=zoom)]
+    in_view = in_view.assign(
+        status=np.where(in_view['is_encroachment'], 'Encroachment', 'Compliant')
+    )
+
+    m = folium.Map(
+        location=[results['latitude'].mean(), results['longitude'].mean()],
+        zoom_start=zoom,
+        prefer_canvas=True
+    )
+    add_point_layer(
+        m,
+        in_view,
+        color_column='status',
+        colors={'Encroachment': 'red', 'Compliant': 'green'},
+        popup_fields=['status', 'severity', 'distance_meters', 'building'],
+        popup_aliases=['Status', 'Severity', 'Distance (m)', 'Type'],
+        radius=6
+    )
+
+    return m.get_root().render(), len(in_view)
+
+
+def benchmark_pipeline(n_buildings, export_format='parquet', mode='distance', seed=42):
+    """
+    Time every pipeline stage on one synthetic city
+
+    Stages:
+
+    - load: read the city's roads and footprints from GeoParquet
+    - project: reproject both to the metric CRS and build the road index
+    - distance: nearest road edge and distance of every building
+    - classify: reserve widths, encroachment flags, severity and chainage
+    - export: write the result table in ``export_format``
+    - render: viewport query, point layer and map HTML
+
+    Parameters:
+    -----------
+    n_buildings : int
+        Number of building footprints
+    export_format : str
+        One of ``exporter.EXPORT_FORMATS``
+    mode : str
+        Encroachment mode passed to ``identify_encroachments``
+    seed : int
+        Random seed of the city
+
+    Returns:
+    --------
+    dict with the city size and, per stage, seconds, rows per second and
+    the peak RSS reached by the end of the stage, plus the loader's
+    per-method ``profile``
+    """
+    from exporter import EXPORT_FORMATS, export as export_results
+
+    roads, buildings = create_synthetic_city(n_buildings, seed=seed)
+
+    report = {
+        'buildings': n_buildings,
+        'road_edges': len(roads),
+        'mode': mode,
+        'export_format': export_format,
+        'stages': {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        roads_path = os.path.join(tmp_dir, 'roads.parquet')
+        buildings_path = os.path.join(tmp_dir, 'buildings.parquet')
+        roads.to_parquet(roads_path)
+        buildings.to_parquet(buildings_path)
+        del roads, buildings
+
+        loader = EncroachmentDataLoader()
+        state = {}
+
+        def load():
+            loader.road_gdf = gpd.read_parquet(roads_path)
+            loader.buildings_gdf = gpd.read_parquet(buildings_path)
+
+        def classify():
+            loader.identify_encroachments(mode=mode, reserve_widths=True)
+            loader.calculate_chainage()
+
+        def export():
+            extension = EXPORT_FORMATS[export_format][0]
+            state['results'] = loader.get_result_table()
+            export_results(loader.buildings_gdf,
+                           os.path.join(tmp_dir, 'results' + extension), fmt=export_format)
+
+        def render():
+            html, drawn = render_map(state['results'])
+            report['map_points'] = drawn
+            report['map_html_bytes'] = len(html)
+
+        stages = {
+            'load': load,
+            'project': loader.project_data,
+            'distance': loader.calculate_distances,
+            'classify': classify,
+            'export': export,
+            'render': render,
+        }
+
+        for name in PIPELINE_STAGES:
+            start = time.perf_counter()
+            stages[name]()
+            elapsed = time.perf_counter() - start
+
+            report['stages'][name] = {
+                'seconds': round(elapsed, 3),
+                'rows_per_second': round(n_buildings / elapsed) if elapsed > 0 else None,
+                'peak_rss_mb': peak_rss_mb(),
+            }
+
+    total = sum(stage['seconds'] for stage in report['stages'].values())
+    report['total_seconds'] = round(total, 3)
+    report['rows_per_second'] = round(n_buildings / total) if total > 0 else None
+    report['encroachments'] = int(state['results']['is_encroachment'].sum())
+    # The loader's own records break the stages down by method and sub-step
+    report['profile'] = json.loads(
+        loader.profiler.summary().reset_index().to_json(orient='records')
+    )
+
+    return report
+
+
+def benchmark_parallel(n_buildings, workers, tile_size=2000):
+    """
+    Time calculate_distances against calculate_distances_parallel
+    """
+    roads, buildings = create_synthetic_city(n_buildings)
+
+    loader = EncroachmentDataLoader(crs="EPSG:32737")
+    loader.road_gdf = roads
+    loader.buildings_gdf = buildings.copy()
+    loader.project_data()
+
+    start = time.perf_counter()
+    loader.calculate_distances()
+    serial = time.perf_counter() - start
+    reference = loader.buildings_gdf['distance_to_road'].to_numpy()
+
+    report = {
+        'buildings': n_buildings,
+        'road_edges': len(roads),
+        'cpu_count': os.cpu_count(),
+        'serial_seconds': round(serial, 3),
+        'parallel': [],
+    }
+
+    for n_workers in workers:
+        loader.buildings_gdf = buildings.copy()
+        loader.buildings_proj = None
+        loader.project_data()
+
+        start = time.perf_counter()
+        loader.calculate_distances_parallel(n_workers=n_workers, tile_size=tile_size)
+        elapsed = time.perf_counter() - start
+
+        distance = loader.buildings_gdf['distance_to_road'].to_numpy()
+        report['parallel'].append({
+            'workers': n_workers,
+            'seconds': round(elapsed, 3),
+            'speedup': round(serial / elapsed, 2),
+            'matches_serial': bool(np.allclose(distance, reference, equal_nan=True)),
+        })
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Encroachment pipeline benchmarks")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    pipeline = commands.add_parser('pipeline', help="Time every stage per city size")
+    pipeline.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    pipeline.add_argument('--format', default='parquet', dest='export_format')
+    pipeline.add_argument('--mode', choices=['distance', 'overlap'], default='distance')
+
+    parallel = commands.add_parser('parallel', help="Scaling of the parallel distance pass")
+    parallel.add_argument('--buildings', type=int, default=100000)
+    parallel.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parallel.add_argument('--tile-size', type=float, default=2000)
+
+    args = parser.parse_args()
+
+    if args.command == 'pipeline':
+        # Peak RSS never decreases, so sizes run smallest first
+        report = {
+            'cpu_count': os.cpu_count(),
+            'runs': [
+                benchmark_pipeline(n, args.export_format, args.mode)
+                for n in sorted(args.sizes)
+            ],
+        }
+    else:
+        report = benchmark_parallel(args.buildings, args.workers, args.tile_size)
+
+    print(json.dumps(report, indent=2))
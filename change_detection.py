@@ -0,0 +1,140 @@
+"""
+Change Detection
+New, resolved and persisting encroachments between dated snapshots
+
+Consecutive snapshots are joined on the building key. Keys are sorted per
+snapshot, so each join is a binary search (``np.searchsorted``) over the
+previous snapshot rather than a hash join.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+STATUSES = ('new', 'resolved', 'persisting')
+
+
+def _member(keys, sorted_keys):
+    """
+    Whether each of ``keys`` occurs in the sorted array ``sorted_keys``
+    """
+    if len(sorted_keys) == 0:
+        return np.zeros(len(keys), dtype=bool)
+    position = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return sorted_keys[position] == keys
+
+
+def encroachment_transitions(snapshots):
+    """
+    Status of each building at each snapshot relative to the one before
+
+    Parameters:
+    -----------
+    snapshots : DataFrame
+        ``date``, ``building_key``, ``road_name`` and ``segment`` of the
+        encroaching buildings per snapshot, as from
+        ``ResultStore.load_snapshots``
+
+    Returns:
+    --------
+    DataFrame with date, building_key, road_name, segment and status:
+    'new' (not encroaching at the previous snapshot), 'persisting' or
+    'resolved' (no longer encroaching, reported at the date it was first
+    missing). The first snapshot is the baseline and produces no rows.
+    """
+    snapshots = snapshots.sort_values(['date', 'building_key'], kind='stable')
+    dates = snapshots['date'].to_numpy()
+    keys = snapshots['building_key'].to_numpy()
+    segments = snapshots['segment'].to_numpy()
+    # Road names travel as integer codes and are restored at the end
+    roads, road_names = pd.factorize(
+        snapshots['road_name'] if 'road_name' in snapshots
+        else pd.Series('unknown', index=snapshots.index)
+    )
+
+    # Row ranges of each snapshot in the sorted frame
+    unique_dates, starts = np.unique(dates, return_index=True)
+    ends = np.append(starts[1:], len(dates))
+
+    frames = []
+    for i in range(1, len(unique_dates)):
+        previous = slice(starts[i - 1], ends[i - 1])
+        current = slice(starts[i], ends[i])
+
+        persisting = _member(keys[current], keys[previous])
+        resolved = ~_member(keys[previous], keys[current])
+
+        frames.append(pd.DataFrame({
+            'date': unique_dates[i],
+            'building_key': np.concatenate([keys[current], keys[previous][resolved]]),
+            'road_name': np.concatenate([roads[current], roads[previous][resolved]]),
+            'segment': np.concatenate([segments[current], segments[previous][resolved]]),
+            'status': np.concatenate([
+                np.where(persisting, 2, 0), np.ones(resolved.sum(), dtype=np.int64)
+            ]).astype(np.int8)
+        }))
+
+    if not frames:
+        return pd.DataFrame({
+            'date': pd.Series(dtype='datetime64[ns]'),
+            'building_key': pd.Series(dtype=np.uint64),
+            'road_name': pd.Categorical([], categories=road_names),
+            'segment': pd.Series(dtype=np.int32),
+            'status': pd.Categorical([], categories=STATUSES)
+        })
+
+    transitions = pd.concat(frames, ignore_index=True)
+    transitions['road_name'] = pd.Categorical.from_codes(transitions['road_name'], road_names)
+    transitions['status'] = pd.Categorical.from_codes(transitions['status'], STATUSES)
+    return transitions
+
+
+def monthly_change_series(transitions, by_segment=False):
+    """
+    Counts of new, resolved and persisting encroachments per month
+
+    New and resolved counts add up over all snapshots in the month;
+    persisting is taken from the month's last snapshot so a building seen
+    at several snapshots is counted once.
+
+    Parameters:
+    -----------
+    transitions : DataFrame
+        Output of ``encroachment_transitions``
+    by_segment : bool
+        Also break the series down by road segment, keyed by road name and
+        segment number since numbering restarts on every road
+
+    Returns:
+    --------
+    DataFrame indexed by month (and road_name, segment) with one column
+    per status
+    """
+    segment_keys = ['road_name', 'segment'] if by_segment else []
+    keys = ['month'] + segment_keys
+
+    # Count per snapshot first; months are then looked up per date only
+    counts = transitions.groupby(
+        ['date'] + segment_keys + ['status'], observed=True
+    ).size().rename('count').reset_index()
+    if by_segment:
+        # Plain labels: categorical index levels do not survive the union below
+        counts['road_name'] = counts['road_name'].astype(object)
+    counts['month'] = counts['date'].dt.to_period('M').astype(str)
+
+    flows = counts[counts['status'] != 'persisting']
+    series = flows.pivot_table(
+        index=keys, columns='status', values='count', aggfunc='sum',
+        fill_value=0, observed=True
+    )
+    series.columns = series.columns.astype(str)
+
+    last = counts[counts['date'] == counts.groupby('month')['date'].transform('max')]
+    persisting = last[last['status'] == 'persisting'].groupby(keys)['count'].sum()
+
+    series = series.reindex(
+        series.index.union(persisting.index), columns=list(STATUSES), fill_value=0
+    )
+    series['persisting'] = persisting.reindex(series.index, fill_value=0)
+
+    return series.fillna(0).astype(np.int64)
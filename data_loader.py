@@ -3,23 +3,254 @@ Data Integration Module
 Helper functions for loading and processing encroachment data from various sources
 """
 
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
 import pandas as pd
 import geopandas as gpd
 from shapely.geometry import Point, LineString, Polygon
+import shapely
 import osmnx as ox
 import numpy as np
 
+from profiling import StageProfiler, profiled
+from severity import SEVERITY_EDGES, classify_severity
+
+
+# Road reserve widths in meters from the centerline, keyed by the OSM
+# ``highway`` tag. Link roads share the width of the road they connect to.
+ROAD_RESERVE_WIDTHS = {
+    'motorway': 40,
+    'motorway_link': 40,
+    'trunk': 30,
+    'trunk_link': 30,
+    'primary': 25,
+    'primary_link': 25,
+    'secondary': 20,
+    'secondary_link': 20,
+    'tertiary': 15,
+    'tertiary_link': 15,
+    'unclassified': 10,
+    'residential': 9,
+    'living_street': 6,
+    'service': 6,
+}
+
+# Identifier columns of OSM features, most specific first: road edges,
+# osmnx 1 / PBF buildings, osmnx 2 buildings, then a bare OSM id
+OSM_KEY_COLUMNS = (
+    ('u', 'v', 'key'), ('element_type', 'osmid'), ('element', 'id'), ('osmid',), ('id',)
+)
+
+# Per-building columns written by the distance and classification steps
+RESULT_COLUMNS = (
+    'distance_to_road', 'nearest_edge', 'distance_meters', 'reserve_width_m',
+    'is_encroachment', 'severity', 'overlap_area_m2', 'intrusion_depth_m'
+)
+
+
+class RoadIndex:
+    """
+    Spatial index over individual road edges for batched nearest-road queries
+
+    Wraps a Shapely 2 STRtree built once over the edge geometries so that
+    every building is matched to its nearest edge in a single vectorized
+    call instead of one distance computation per building.
+    """
+    
+    def __init__(self, road_geoms):
+        self.geoms = np.asarray(road_geoms, dtype=object)
+        self.tree = shapely.STRtree(self.geoms)
+    
+    def __len__(self):
+        return len(self.geoms)
+    
+    def within(self, geoms, distance):
+        """
+        Boolean mask of geometries lying within ``distance`` of any road edge
+        """
+        geoms = np.asarray(geoms, dtype=object)
+        mask = np.zeros(len(geoms), dtype=bool)
+        
+        if len(geoms) == 0 or len(self.geoms) == 0:
+            return mask
+        
+        src, _ = self.tree.query(geoms, predicate='dwithin', distance=distance)
+        mask[src] = True
+        
+        return mask
+    
+    def nearest(self, geoms):
+        """
+        Find the nearest road edge for every geometry in one batched pass
+        
+        Parameters:
+        -----------
+        geoms : array-like of shapely geometries
+            Building footprints (or any geometries) to match
+        
+        Returns:
+        --------
+        tuple of (distance, edge, point)
+            ``distance`` is a float array, ``edge`` the positional index of the
+            nearest edge (-1 when no match, e.g. empty geometries) and
+            ``point`` the closest point on that edge.
+        """
+        geoms = np.asarray(geoms, dtype=object)
+        n = len(geoms)
+        
+        distance = np.full(n, np.nan)
+        edge = np.full(n, -1, dtype=np.int64)
+        point = np.full(n, None, dtype=object)
+        
+        if n == 0 or len(self.geoms) == 0:
+            return distance, edge, point
+        
+        # all_matches=False keeps exactly one edge per building on ties
+        (src, dst), dist = self.tree.query_nearest(
+            geoms, return_distance=True, all_matches=False
+        )
+        distance[src] = dist
+        edge[src] = dst
+        
+        # Closest point on the matched edge is the end of the shortest line
+        lines = shapely.shortest_line(geoms[src], self.geoms[dst])
+        point[src] = shapely.get_point(lines, 1)
+        
+        return distance, edge, point
+
+
+def _nearest_in_tile(building_geoms, road_geoms, road_ids):
+    """
+    Worker task: nearest edge for one tile against the tile's own edges
+    """
+    distance, edge, point = RoadIndex(road_geoms).nearest(building_geoms)
+    matched = edge >= 0
+    edge[matched] = road_ids[edge[matched]]
+    return distance, edge, point
+
+
+def features_from_place(place_name, tags):
+    """
+    OSM features of a place; osmnx 2 renamed ``geometries_*`` to ``features_*``
+    """
+    if hasattr(ox, 'features_from_place'):
+        return ox.features_from_place(place_name, tags=tags)
+    return ox.geometries_from_place(place_name, tags=tags)
+
+
+def features_from_polygon(polygon, tags):
+    """
+    OSM features inside a polygon, for osmnx 1.x and 2.x
+    """
+    if hasattr(ox, 'features_from_polygon'):
+        return ox.features_from_polygon(polygon, tags=tags)
+    return ox.geometries_from_polygon(polygon, tags=tags)
+
+
+def feature_keys(gdf):
+    """
+    Stable 64-bit identifiers of OSM features across snapshots
+    
+    Road edges are keyed by their (u, v, key) graph nodes, buildings by
+    element type and OSM id: (element_type, osmid) from osmnx 1 and the PBF
+    loader, (element, id) from osmnx 2. These are read from index levels
+    (osmnx) or columns (PBF loader and stored results). Only the values are
+    hashed, so both namings of the same feature get the same key.
+    
+    Raises ValueError when the frame carries no OSM identifiers.
+    """
+    frame = gdf.index.to_frame(index=False) if any(
+        name is not None for name in gdf.index.names
+    ) else pd.DataFrame(index=range(len(gdf)))
+    for columns in OSM_KEY_COLUMNS:
+        for column in columns:
+            if column in gdf.columns and column not in frame:
+                frame[column] = gdf[column].to_numpy()
+    
+    for columns in OSM_KEY_COLUMNS:
+        if all(column in frame for column in columns):
+            return pd.util.hash_pandas_object(
+                frame[list(columns)].astype(str), index=False
+            ).to_numpy()
+    
+    raise ValueError(
+        "No OSM identifiers to key features by; expected one of "
+        + ", ".join('(' + ', '.join(columns) + ')' for columns in OSM_KEY_COLUMNS)
+        + " as index levels or columns"
+    )
+
+
+def geometry_hashes(gdf, columns=()):
+    """
+    64-bit hash of each feature's WKB geometry and optional attribute columns
+    """
+    parts = {'wkb': shapely.to_wkb(gdf.geometry.to_numpy())}
+    for column in columns:
+        if column in gdf:
+            parts[column] = gdf[column].astype(str).to_numpy()
+    return pd.util.hash_pandas_object(pd.DataFrame(parts), index=False).to_numpy()
+
+
+def reserve_widths_hash(reserve_widths):
+    """
+    Fingerprint of the reserve widths a classification used
+    
+    None and False (the threshold for every road) give 'uniform', True
+    stands for ROAD_RESERVE_WIDTHS and a dict is hashed by its contents, so
+    stored results can be checked against the widths of a new run.
+    """
+    if reserve_widths is None or reserve_widths is False:
+        return 'uniform'
+    if reserve_widths is True:
+        reserve_widths = ROAD_RESERVE_WIDTHS
+    table = json.dumps(
+        {str(tag): float(width) for tag, width in reserve_widths.items()}, sort_keys=True
+    )
+    return hashlib.sha1(table.encode()).hexdigest()[:16]
+
+
+def _building_rows(loader):
+    return 0 if loader.buildings_gdf is None else len(loader.buildings_gdf)
+
+
+def _road_rows(loader):
+    return 0 if loader.road_gdf is None else len(loader.road_gdf)
+
+
 class EncroachmentDataLoader:
     """
     Load and process encroachment data for the Streamlit application
+    
+    Pass an ``OSMCache`` as ``cache`` to serve repeat downloads from disk.
+    Wall time, CPU time, rows and memory of every pipeline stage are
+    recorded in ``profiler``; pass ``StageProfiler(enabled=False)`` to
+    turn that off.
     """
     
-    def __init__(self, road_name="Outer Ring Road", city="Nairobi, Kenya"):
+    def __init__(self, road_name="Outer Ring Road", city="Nairobi, Kenya",
+                 crs="EPSG:32737", cache=None, profiler=None):
         self.road_name = road_name
         self.city = city
+        self.crs = crs
+        self.cache = cache
+        self.profiler = profiler if profiler is not None else StageProfiler()
         self.buildings_gdf = None
         self.road_gdf = None
+        self.road_proj = None
+        self.buildings_proj = None
+        self.road_index = None
+        self.graph = None
+        self.nearest_points = None
+        self.reserve_polygon = None
+        self.reserve_width = None
+        self.segment_length = None
+        self.encroachment_settings = {}
         
+    @profiled(rows=_road_rows)
     def load_road_network(self):
         """
         Load road network from OpenStreetMap
@@ -28,11 +259,20 @@ class EncroachmentDataLoader:
             # Get road network for the area
             place_name = f"{self.road_name}, {self.city}"
             
-            # Download road network
-            G = ox.graph_from_place(place_name, network_type='drive')
+            # Download road network, or read it from the cache
+            download = lambda: ox.graph_from_place(place_name, network_type='drive')
+            with self.profiler.stage('download_roads'):
+                if self.cache is not None:
+                    G = self.cache.get_graph(place_name, 'drive', download)
+                else:
+                    G = download()
             
-            # Convert to GeoDataFrame
-            self.road_gdf = ox.graph_to_gdfs(G, nodes=False, edges=True)
+            # Keep the graph for network analysis; edges drive the geometry work
+            self.graph = G
+            with self.profiler.stage('graph_to_gdfs', rows=G.number_of_edges()):
+                self.road_gdf = ox.graph_to_gdfs(G, nodes=False, edges=True)
+            self.road_proj = None
+            self.road_index = None
             
             return self.road_gdf
             
@@ -40,6 +280,7 @@ class EncroachmentDataLoader:
             print(f"Error loading road network: {e}")
             return None
     
+    @profiled(rows=_building_rows)
     def load_buildings(self, buffer_distance=100):
         """
         Load buildings within buffer distance of the road
@@ -53,13 +294,27 @@ class EncroachmentDataLoader:
             # Get buildings from OSM
             place_name = f"{self.road_name}, {self.city}"
             
-            # Download building footprints
-            buildings = ox.geometries_from_place(
-                place_name,
-                tags={'building': True}
-            )
+            # Download building footprints, or read them from the cache
+            tags = {'building': True}
+            download = lambda: features_from_place(place_name, tags)
+            with self.profiler.stage('download_buildings') as record:
+                if self.cache is not None:
+                    buildings = self.cache.get_geometries(place_name, tags, download)
+                else:
+                    buildings = download()
+                record['rows'] = len(buildings)
             
             self.buildings_gdf = buildings
+            self.buildings_proj = None
+            
+            # Keep only buildings within the buffer when the road is known
+            if self.road_gdf is not None:
+                self.project_data()
+                keep = self.road_index.within(
+                    self.buildings_proj.values, buffer_distance
+                )
+                self.buildings_gdf = buildings[keep]
+                self.buildings_proj = self.buildings_proj[keep]
             
             return self.buildings_gdf
             
@@ -67,82 +322,828 @@ class EncroachmentDataLoader:
             print(f"Error loading buildings: {e}")
             return None
     
+    @profiled(rows=_building_rows)
+    def load_pbf(self, pbf_path, buildings=True, chunk_size=100000,
+                 highway_types=None):
+        """
+        Load roads and buildings from a local .osm.pbf extract
+        
+        The file is streamed with pyosmium in chunks, so no network access
+        is needed. For extracts whose buildings do not fit in memory, load
+        the roads only and stream footprints with
+        ``pbf_loader.iter_pbf_chunks(pbf_path, 'buildings')``.
+        
+        Parameters:
+        -----------
+        pbf_path : str
+            Path to the .osm.pbf file
+        buildings : bool
+            Also load building footprints into ``buildings_gdf``
+        chunk_size : int
+            Number of features read per chunk
+        highway_types : iterable of str
+            Only keep roads with these highway tags (default: all)
+        """
+        from pbf_loader import read_pbf_layer
+        
+        try:
+            self.road_gdf = read_pbf_layer(
+                pbf_path, 'roads',
+                chunk_size=chunk_size,
+                highway_types=highway_types
+            )
+            self.road_proj = None
+            self.road_index = None
+            
+            if buildings:
+                self.buildings_gdf = read_pbf_layer(
+                    pbf_path, 'buildings', chunk_size=chunk_size
+                )
+                self.buildings_proj = None
+            
+            return self.road_gdf, self.buildings_gdf
+            
+        except Exception as e:
+            print(f"Error loading PBF extract: {e}")
+            return None
+    
+    def _to_metric(self, gdf):
+        """
+        Reproject geometries to the loader's metric CRS
+        """
+        geometry = gdf.geometry
+        
+        # OSM data without CRS metadata is WGS84 longitude/latitude
+        if geometry.crs is None:
+            geometry = geometry.set_crs("EPSG:4326")
+        
+        return geometry.to_crs(self.crs)
+    
+    @profiled(rows=_building_rows)
+    def project_data(self):
+        """
+        Reproject roads and buildings to the metric CRS once and cache them
+        
+        The projected geometries are kept in ``self.road_proj`` and
+        ``self.buildings_proj`` so distances and buffers are computed in
+        meters without touching the original lon/lat GeoDataFrames.
+        """
+        if self.road_gdf is not None and (
+            self.road_proj is None
+            or not self.road_proj.index.equals(self.road_gdf.index)
+        ):
+            self.road_proj = self._to_metric(self.road_gdf)
+            self.road_index = None
+            self.reserve_polygon = None
+        
+        if self.road_proj is not None and self.road_index is None:
+            self.road_index = RoadIndex(self.road_proj.values)
+        
+        if self.buildings_gdf is not None and (
+            self.buildings_proj is None
+            or not self.buildings_proj.index.equals(self.buildings_gdf.index)
+        ):
+            self.buildings_proj = self._to_metric(self.buildings_gdf)
+        
+        return self.road_proj, self.buildings_proj
+    
+    @profiled(rows=_building_rows)
     def calculate_distances(self):
         """
-        Calculate distance of each building from the road centerline
+        Calculate distance in meters of each building from the road centerline
+        
+        Also records the positional index of the nearest road edge in
+        ``nearest_edge`` and keeps the closest point on that edge in
+        ``self.nearest_points``.
+        """
+        if self.road_gdf is None or self.buildings_gdf is None:
+            print("Please load road and building data first")
+            return None
+        
+        # Projections and the edge index are built once and reused
+        self.project_data()
+        
+        # Nearest edge, distance and closest point for all buildings at once
+        distance, edge, point = self.road_index.nearest(
+            self.buildings_proj.values
+        )
+        
+        self.buildings_gdf['distance_to_road'] = distance
+        self.buildings_gdf['nearest_edge'] = edge
+        self.nearest_points = gpd.GeoSeries(
+            point, index=self.buildings_gdf.index, crs=self.crs
+        )
+        
+        return self.buildings_gdf
+    
+    @profiled(rows=_building_rows)
+    def calculate_distances_parallel(self, n_workers=None, tile_size=2000,
+                                     margin=100):
+        """
+        Calculate distances with a process pool over square spatial tiles
+        
+        Buildings are grouped into tiles by bounding box center. Each worker receives
+        only its tile's buildings and the road edges intersecting the tile
+        expanded by ``margin``. Results are written back by position, so
+        the output does not depend on worker scheduling. Buildings whose
+        nearest edge lies beyond the margin are re-checked against the full
+        index in the parent process, so distances match
+        ``calculate_distances`` exactly (ties between equidistant edges may
+        pick a different edge).
+        
+        Parameters:
+        -----------
+        n_workers : int
+            Number of worker processes (default: one per CPU)
+        tile_size : float
+            Tile edge length in meters
+        margin : float
+            Distance in meters added around each tile when selecting edges
+        """
+        if self.road_gdf is None or self.buildings_gdf is None:
+            print("Please load road and building data first")
+            return None
+        
+        self.project_data()
+        
+        geoms = self.buildings_proj.values
+        n = len(geoms)
+        distance = np.full(n, np.nan)
+        edge = np.full(n, -1, dtype=np.int64)
+        point = np.full(n, None, dtype=object)
+        
+        if n > 0:
+            # Tile key per building from its bounding box center; empty
+            # geometries have NaN bounds and fall into the first tile
+            box_bounds = shapely.bounds(geoms)
+            xy = (box_bounds[:, :2] + box_bounds[:, 2:]) / 2
+            xy = np.where(np.isnan(xy), np.nanmin(xy, axis=0), xy)
+            cells = np.floor((xy - xy.min(axis=0)) / tile_size).astype(np.int64)
+            _, tile_of = np.unique(cells, axis=0, return_inverse=True)
+            tile_of = tile_of.ravel()
+            order = np.argsort(tile_of, kind='stable')
+            bounds = np.flatnonzero(np.diff(tile_of[order])) + 1
+            tiles = np.split(order, bounds)
+            
+            # Each task carries its buildings plus the nearby edges only
+            tasks = []
+            for members in tiles:
+                extent = shapely.box(*shapely.total_bounds(geoms[members]))
+                road_ids = self.road_index.tree.query(
+                    extent, predicate='dwithin', distance=margin
+                )
+                tasks.append((geoms[members], self.road_index.geoms[road_ids], road_ids))
+            
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                results = executor.map(_nearest_in_tile, *zip(*tasks))
+                for members, (tile_distance, tile_edge, tile_point) in zip(tiles, results):
+                    distance[members] = tile_distance
+                    edge[members] = tile_edge
+                    point[members] = tile_point
+            
+            # Anything not resolved within the margin uses the full index
+            retry = (edge < 0) | (distance > margin)
+            retry &= ~shapely.is_empty(geoms) & ~shapely.is_missing(geoms)
+            if retry.any():
+                distance[retry], edge[retry], point[retry] = (
+                    self.road_index.nearest(geoms[retry])
+                )
+        
+        self.buildings_gdf['distance_to_road'] = distance
+        self.buildings_gdf['nearest_edge'] = edge
+        self.nearest_points = gpd.GeoSeries(
+            point, index=self.buildings_gdf.index, crs=self.crs
+        )
+        
+        return self.buildings_gdf
+    
+    def get_edge_reserve_widths(self, reserve_widths=None, default=30):
+        """
+        Reserve width of every road edge from its OSM ``highway`` class
+        
+        Parameters:
+        -----------
+        reserve_widths : dict
+            Width in meters keyed by highway tag (default ROAD_RESERVE_WIDTHS)
+        default : float
+            Width used for edges with a missing or unlisted highway tag
+        """
+        if reserve_widths is None:
+            reserve_widths = ROAD_RESERVE_WIDTHS
+        
+        if 'highway' not in self.road_gdf.columns:
+            return np.full(len(self.road_gdf), float(default))
+        
+        # Simplified osmnx edges can carry a list of tags; use the first
+        highway = self.road_gdf['highway'].map(
+            lambda h: h[0] if isinstance(h, list) else h
+        )
+        
+        return highway.map(reserve_widths).fillna(default).to_numpy(dtype=float)
+    
+    def _building_reserve_widths(self, edge_widths, default):
+        """
+        Look up the reserve width of each building's nearest edge
+        """
+        edge = self.buildings_gdf['nearest_edge'].to_numpy()
+        widths = np.full(len(edge), float(default))
+        matched = edge >= 0
+        widths[matched] = edge_widths[edge[matched]]
+        
+        return widths
+    
+    @profiled(rows=_building_rows)
+    def calculate_reserve_overlap(self, reserve_width=30):
+        """
+        Intersect building footprints with the road reserve polygon
+        
+        The reserve is built once as the union of all road edges buffered by
+        ``reserve_width``. Only buildings the edge index reports within the
+        reserve width are clipped against it, so the expensive polygon
+        intersection runs on a small fraction of the footprints.
+        
+        Parameters:
+        -----------
+        reserve_width : float or array
+            Reserve width in meters measured from the road centerline,
+            either one value or one value per road edge
         """
         if self.road_gdf is None or self.buildings_gdf is None:
             print("Please load road and building data first")
             return None
         
-        # Create a unified road geometry
-        road_union = self.road_gdf.unary_union
+        if 'distance_to_road' not in self.buildings_gdf.columns:
+            self.calculate_distances()
+        
+        self.project_data()
+        
+        edge_widths = np.broadcast_to(
+            np.asarray(reserve_width, dtype=float), (len(self.road_proj),)
+        )
+        
+        # Build the reserve polygon once per set of widths
+        if self.reserve_polygon is None or not np.array_equal(
+            self.reserve_width, edge_widths
+        ):
+            with self.profiler.stage('reserve_union', rows=len(edge_widths)):
+                self.reserve_polygon = shapely.union_all(
+                    shapely.buffer(self.road_proj.values, edge_widths)
+                )
+            self.reserve_width = edge_widths.copy()
+        
+        geoms = self.buildings_proj.values
+        area = np.zeros(len(geoms))
+        
+        # STRtree prefilter: only clip footprints close to a road edge
+        max_width = edge_widths.max() if len(edge_widths) else 0.0
+        candidates = self.road_index.within(geoms, max_width)
+        if candidates.any():
+            with self.profiler.stage('clip_footprints', rows=int(candidates.sum())):
+                overlap = shapely.intersection(geoms[candidates], self.reserve_polygon)
+                area[candidates] = shapely.area(overlap)
         
-        # Calculate distances
-        self.buildings_gdf['distance_to_road'] = self.buildings_gdf.geometry.apply(
-            lambda x: x.distance(road_union)
+        # The deepest point of a footprint is the one closest to the centerline
+        widths = self._building_reserve_widths(edge_widths, max_width)
+        depth = np.clip(
+            widths - self.buildings_gdf['distance_to_road'].to_numpy(),
+            0, None
         )
         
+        self.buildings_gdf['overlap_area_m2'] = area
+        self.buildings_gdf['intrusion_depth_m'] = np.where(candidates, depth, 0.0)
+        
         return self.buildings_gdf
     
-    def identify_encroachments(self, threshold=30):
+    @profiled(rows=_building_rows)
+    def identify_encroachments(self, threshold=30, mode='distance',
+                               reserve_widths=None, severity_edges=SEVERITY_EDGES):
         """
         Identify buildings that encroach on the road reserve
         
+        Distances are cached after the first call, so re-running with a
+        different threshold only re-evaluates the comparison.
+        
         Parameters:
         -----------
         threshold : int
-            Distance threshold in meters (default 30m for Nairobi)
+            Distance threshold in meters (default 30m for Nairobi). With
+            ``reserve_widths`` it is the fallback for unlisted road classes.
+        mode : str
+            'distance' flags buildings closer than the threshold to the
+            centerline; 'overlap' flags footprints whose area intersects the
+            reserve polygon and reports overlap area and intrusion depth
+        reserve_widths : dict or bool
+            Per-road-class widths keyed by OSM highway tag; each building is
+            compared against the width of its nearest edge. Pass True to use
+            ROAD_RESERVE_WIDTHS.
+        severity_edges : sequence of float
+            Severity bin edges as fractions of the reserve width, see
+            ``severity.classify_severity``
         """
         if 'distance_to_road' not in self.buildings_gdf.columns:
             self.calculate_distances()
         
-        # Convert distances from degrees to meters (approximate)
-        # 1 degree ≈ 111,000 meters at equator
-        self.buildings_gdf['distance_meters'] = (
-            self.buildings_gdf['distance_to_road'] * 111000
-        )
+        # Distances are already metric, computed in the projected CRS
+        self.buildings_gdf['distance_meters'] = self.buildings_gdf['distance_to_road']
+        
+        # Recorded with saved results so update_results can tell whether
+        # they were classified the same way
+        self.encroachment_settings = {
+            'threshold': threshold,
+            'mode': mode,
+            'reserve_widths': reserve_widths_hash(reserve_widths),
+        }
+        
+        # Reserve width per edge, then per building via its nearest edge
+        if reserve_widths is None or reserve_widths is False:
+            edge_widths = np.full(len(self.road_gdf), float(threshold))
+        else:
+            if reserve_widths is True:
+                reserve_widths = None
+            edge_widths = self.get_edge_reserve_widths(reserve_widths, threshold)
+        
+        widths = self._building_reserve_widths(edge_widths, threshold)
+        self.buildings_gdf['reserve_width_m'] = widths
         
         # Identify encroachments
-        self.buildings_gdf['is_encroachment'] = (
-            self.buildings_gdf['distance_meters'] < threshold
+        if mode == 'overlap':
+            self.calculate_reserve_overlap(reserve_width=edge_widths)
+            self.buildings_gdf['is_encroachment'] = (
+                self.buildings_gdf['overlap_area_m2'] > 0
+            )
+        elif mode == 'distance':
+            self.buildings_gdf['is_encroachment'] = (
+                self.buildings_gdf['distance_meters'].to_numpy() < widths
+            )
+        else:
+            raise ValueError(f"Unknown encroachment mode: {mode}")
+        
+        # Categorize severity in thirds of the applicable reserve width
+        with self.profiler.stage('classify_severity', rows=len(widths)):
+            self.buildings_gdf['severity'] = classify_severity(
+                self.buildings_gdf['distance_meters'].to_numpy(), widths, severity_edges
+            )
+        
+        return self.buildings_gdf
+    
+    def get_edge_road_names(self):
+        """
+        Road each edge belongs to for chainage: its OSM name, else its ref
+        """
+        def first(value):
+            return value[0] if isinstance(value, list) else value
+        
+        names = pd.Series(None, index=self.road_gdf.index, dtype=object)
+        for column in ('ref', 'name'):
+            if column in self.road_gdf:
+                values = self.road_gdf[column].map(first)
+                names = values.where(values.notna(), names)
+        
+        return names.fillna('unnamed').astype(str).to_numpy(dtype=object)
+    
+    @profiled(rows=_building_rows)
+    def calculate_chainage(self, segment_length=100, road_names=None):
+        """
+        Linear-reference buildings along their road and bin them into segments
+        
+        The edges of each named road are merged along their direction of
+        travel and the longest merged line is the road's reference
+        centerline. The closest point of every building on its nearest edge
+        is located along that line with ``line_locate_point`` (one
+        vectorised call per road, on edge and building groups formed once up
+        front). Both carriageways of a divided road are measured on the same
+        reference, so buildings facing each other get the same chainage;
+        branches and disconnected stretches are measured by their projection
+        onto it.
+        
+        Parameters:
+        -----------
+        segment_length : float
+            Length in meters of the fixed segments along each road
+        road_names : array-like
+            Optional road of each edge, overriding ``get_edge_road_names``
+        
+        Adds ``road_name``, ``chainage_m`` and ``segment`` (segment number
+        from the start of the road) to ``buildings_gdf``.
+        """
+        if self.buildings_gdf is None or 'nearest_edge' not in self.buildings_gdf:
+            print("Please calculate distances first")
+            return None
+        
+        self.project_data()
+        
+        edge = self.buildings_gdf['nearest_edge'].to_numpy()
+        matched = edge >= 0
+        
+        if road_names is None:
+            road_names = self.get_edge_road_names()
+        # Road of each edge as a code, and of each building through its edge
+        edge_road, names = pd.factorize(np.asarray(road_names, dtype=object))
+        building_code = np.full(len(edge), -1, dtype=np.int64)
+        building_code[matched] = edge_road[edge[matched]]
+        
+        # Closest point on the nearest edge, from the distance pass if aligned
+        if self.nearest_points is not None and self.nearest_points.index.equals(
+            self.buildings_gdf.index
+        ):
+            points = self.nearest_points.values
+        else:
+            nearest_roads = np.where(matched, self.road_proj.values[np.maximum(edge, 0)], None)
+            points = shapely.get_point(
+                shapely.shortest_line(self.buildings_proj.values, nearest_roads), 1
+            )
+        
+        # Group edges and buildings by road once: a stable sort on the road
+        # codes, split at the road boundaries, gives one index array per road
+        def split_by_road(codes):
+            order = np.argsort(codes, kind='stable')
+            order = order[codes[order] >= 0]
+            counts = np.bincount(codes[order], minlength=len(names))
+            return np.split(order, np.cumsum(counts)[:-1])
+        
+        edges_by_road = split_by_road(edge_road)
+        rows_by_road = split_by_road(building_code)
+        
+        chainage = np.full(len(edge), np.nan)
+        edge_geoms = self.road_proj.values
+        for road, rows in enumerate(rows_by_road):
+            if len(rows) == 0:
+                continue
+            # Merging along the direction of travel gives one chain per
+            # carriageway (or per direction of a two-way street); the longest
+            # is the reference every building of the road is located on
+            pieces = shapely.get_parts(shapely.line_merge(
+                shapely.multilinestrings(shapely.get_parts(edge_geoms[edges_by_road[road]])),
+                directed=True
+            ))
+            line = pieces[np.argmax(shapely.length(pieces))]
+            chainage[rows] = shapely.line_locate_point(line, points[rows])
+        
+        segment = np.full(len(edge), -1, dtype=np.int64)
+        located = ~np.isnan(chainage)
+        segment[located] = np.floor(chainage[located] / segment_length).astype(np.int64)
+        
+        building_road = np.full(len(edge), None, dtype=object)
+        named = building_code >= 0
+        building_road[named] = np.asarray(names, dtype=object)[building_code[named]]
+        
+        self.buildings_gdf['road_name'] = building_road
+        self.buildings_gdf['chainage_m'] = chainage
+        self.buildings_gdf['segment'] = segment
+        self.segment_length = segment_length
+        
+        return self.buildings_gdf
+    
+    @profiled(rows=_building_rows)
+    def get_result_table(self):
+        """
+        Results with the footprint area, road class and lon/lat centroid added
+        
+        These are the columns the app and the result store need, computed
+        once from the projected geometries.
+        """
+        self.project_data()
+        
+        result = self.buildings_gdf.copy()
+        
+        # osmnx 1 indexes features by (element_type, osmid) and osmnx 2 by
+        # (element, id); keep them as columns under one set of names
+        index_names = list(result.index.names)
+        if any(name is not None for name in index_names):
+            result = result.reset_index()
+            if index_names == ['element', 'id']:
+                result = result.rename(columns={'element': 'element_type', 'id': 'osmid'})
+        
+        result['area_m2'] = self.buildings_proj.area.to_numpy()
+        
+        # Highway class of the nearest edge, the road class used by the risk model
+        if 'nearest_edge' in result and 'highway' in self.road_gdf:
+            highway = self.road_gdf['highway'].map(
+                lambda h: h[0] if isinstance(h, list) else h
+            ).to_numpy(dtype=object)
+            edge = result['nearest_edge'].to_numpy()
+            result['road_class'] = np.where(edge >= 0, highway[np.maximum(edge, 0)], None)
+        
+        centroids = self.buildings_proj.centroid.to_crs("EPSG:4326")
+        result['latitude'] = centroids.y.to_numpy()
+        result['longitude'] = centroids.x.to_numpy()
+        
+        return result
+    
+    @profiled(rows=_building_rows)
+    def save_results(self, store, road_id, snapshot_date=None, **metadata):
+        """
+        Write the current results to a ``ResultStore`` as a new version
+        
+        Also records a dated snapshot of the encroaching buildings for
+        change detection.
+        
+        Parameters:
+        -----------
+        store : ResultStore
+            Destination store
+        road_id : str
+            Registry id of the analysed road, e.g. 'ORR-001'
+        snapshot_date : str or datetime
+            Date of the OSM data the results describe (default: today)
+        """
+        if self.buildings_gdf is None or 'is_encroachment' not in self.buildings_gdf:
+            print("Please identify encroachments first")
+            return None
+        
+        from aggregates import build_analytics_cube, build_grid_aggregates
+        
+        self.project_data()
+        metadata.setdefault('road_length_km', float(self.road_proj.length.sum() / 1000))
+        
+        if 'segment' not in self.buildings_gdf:
+            self.calculate_chainage(self.segment_length or 100)
+        metadata.setdefault('segment_length', self.segment_length)
+        for key, value in self.encroachment_settings.items():
+            metadata.setdefault(key, value)
+        
+        result = self.get_result_table()
+        
+        # Snapshots are keyed by the OSM identity columns the result table
+        # carries (element/id or element_type/osmid), never by row position
+        encroaching = result['is_encroachment'].to_numpy(dtype=bool)
+        with self.profiler.stage('write_snapshot', rows=int(encroaching.sum())):
+            store.write_snapshot(
+                road_id,
+                snapshot_date or datetime.now(),
+                feature_keys(result)[encroaching],
+                result['segment'].to_numpy()[encroaching],
+                result['road_name'].to_numpy()[encroaching]
+            )
+        
+        with self.profiler.stage('build_aggregates', rows=len(result)):
+            aggregates = build_grid_aggregates(result, crs=self.crs)
+            cube = build_analytics_cube(result)
+        
+        with self.profiler.stage('write_road', rows=len(result)):
+            return store.write_road(
+                road_id, self.road_name, result,
+                aggregates=aggregates,
+                cube=cube,
+                edges=self.get_edge_table(),
+                **metadata
+            )
+    
+    def get_edge_table(self):
+        """
+        Road edges with stable keys and geometry hashes, in ``nearest_edge`` order
+        
+        Stored with each result version so the next snapshot can be diffed
+        against it by ``update_results``.
+        """
+        return gpd.GeoDataFrame(
+            {
+                'edge_key': feature_keys(self.road_gdf),
+                'edge_hash': geometry_hashes(self.road_gdf, columns=['highway'])
+            },
+            geometry=self.road_gdf.geometry.to_numpy(),
+            crs=self.road_gdf.crs or "EPSG:4326"
         )
+    
+    @profiled(rows=_building_rows)
+    def update_results(self, store, road_id, threshold=30, mode='distance',
+                       reserve_widths=None, **metadata):
+        """
+        Re-analyse a new OSM snapshot against a road's stored results
+        
+        Buildings are matched to the previous version by OSM id and geometry
+        hash, road edges by graph key, geometry and highway tag. Only these
+        buildings are recomputed:
+        
+        - new buildings and buildings whose footprint changed
+        - buildings whose previous nearest edge changed or disappeared
+        - buildings with a new or changed edge closer than their previous
+          distance (in 'overlap' mode: within the widest reserve, where
+          removed edges count as well)
+        
+        Everything else keeps its stored distance and classification, and
+        the merged table is written as the road's next version. Falls back
+        to a full analysis when there is no previous version with an edge
+        table, or the threshold, mode or reserve widths changed.
+        
+        Parameters:
+        -----------
+        store : ResultStore
+            Store holding the previous version; receives the new one
+        road_id : str
+            Registry id of the analysed road
+        threshold, mode, reserve_widths :
+            Passed to ``identify_encroachments``
+        
+        Returns:
+        --------
+        dict with the written path and the number of buildings recomputed
+        """
+        if self.road_gdf is None or self.buildings_gdf is None:
+            print("Please load road and building data first")
+            return None
+        
+        self.project_data()
+        metadata.update(threshold=threshold, mode=mode,
+                        reserve_widths=reserve_widths_hash(reserve_widths))
+        
+        entry = store.get_entry(road_id) if store.has_road(road_id) else None
+        previous_edges = store.load_edges(road_id) if entry else None
+        if (previous_edges is None or entry.get('threshold') != threshold
+                or entry.get('mode') != mode
+                or entry.get('reserve_widths') != metadata['reserve_widths']):
+            self.identify_encroachments(threshold, mode, reserve_widths)
+            path = self.save_results(store, road_id, **metadata)
+            return {'path': path, 'recomputed': len(self.buildings_gdf),
+                    'total': len(self.buildings_gdf)}
+        
+        previous = store.load_road(road_id)
         
-        # Categorize severity
-        self.buildings_gdf['severity'] = pd.cut(
-            self.buildings_gdf['distance_meters'],
-            bins=[0, 10, 20, 30, float('inf')],
-            labels=['Critical', 'High', 'Moderate', 'Compliant']
+        # Edges: map previous positions to current ones where unchanged
+        edge_key = feature_keys(self.road_gdf)
+        edge_hash = geometry_hashes(self.road_gdf, columns=['highway'])
+        current_edges = pd.Series(
+            np.arange(len(edge_key)),
+            index=pd.MultiIndex.from_arrays([edge_key, edge_hash])
         )
+        edge_map = current_edges.reindex(pd.MultiIndex.from_arrays([
+            previous_edges['edge_key'].to_numpy(), previous_edges['edge_hash'].to_numpy()
+        ])).fillna(-1).to_numpy(dtype=np.int64)
+        added_edges = np.setdiff1d(np.arange(len(edge_key)), edge_map[edge_map >= 0])
+        removed_edges = np.flatnonzero(edge_map < 0)
         
-        return self.buildings_gdf
+        # Buildings: find each current building's unchanged previous row
+        previous_rows = pd.Series(
+            np.arange(len(previous)),
+            index=pd.MultiIndex.from_arrays(
+                [feature_keys(previous), geometry_hashes(previous)]
+            )
+        )
+        previous_rows = previous_rows[~previous_rows.index.duplicated()]
+        match = previous_rows.reindex(pd.MultiIndex.from_arrays(
+            [feature_keys(self.buildings_gdf), geometry_hashes(self.buildings_gdf)]
+        )).fillna(-1).to_numpy(dtype=np.int64)
+        
+        dirty = match < 0
+        kept = np.flatnonzero(~dirty)
+        kept_rows = match[kept]
+        
+        previous_edge = previous['nearest_edge'].to_numpy()[kept_rows]
+        new_edge = np.where(previous_edge >= 0, edge_map[np.maximum(previous_edge, 0)], -1)
+        dirty[kept[new_edge < 0]] = True
+        
+        # A changed edge matters if it could be the new nearest edge, or in
+        # overlap mode if its reserve could reach the footprint
+        building_geoms = self.buildings_proj.values
+        reach = previous['distance_to_road'].to_numpy()[kept_rows]
+        changed = self.road_proj.values[added_edges]
+        if mode == 'overlap':
+            widths = self.get_edge_reserve_widths(
+                None if reserve_widths in (None, True, False) else reserve_widths,
+                threshold
+            )
+            reach = np.maximum(reach, max(float(widths.max(initial=0)), threshold))
+            changed = np.concatenate([
+                changed, self._to_metric(previous_edges).values[removed_edges]
+            ])
+        
+        if len(changed) and len(kept):
+            hits, _ = shapely.STRtree(changed).query(
+                building_geoms[kept], predicate='dwithin', distance=reach
+            )
+            dirty[kept[hits]] = True
+        
+        # Recompute the dirty subset against the full current road network
+        snapshot = self.buildings_gdf
+        snapshot_proj = self.buildings_proj
+        
+        self.buildings_gdf = snapshot[dirty].copy()
+        self.buildings_proj = snapshot_proj[dirty]
+        if dirty.any():
+            self.calculate_distances()
+            self.identify_encroachments(threshold, mode, reserve_widths)
+        fresh = self.buildings_gdf
+        
+        # Merge stored values for clean rows with the recomputed ones
+        result = snapshot.copy()
+        for column in RESULT_COLUMNS:
+            if column not in previous:
+                continue
+            values = previous[column].to_numpy()[np.maximum(match, 0)]
+            if column == 'nearest_edge':
+                # Stored positions point into the previous edge table
+                values = edge_map[np.maximum(values, 0)]
+            if dirty.any():
+                values[dirty] = fresh[column].to_numpy()
+            result[column] = pd.Series(values, index=result.index).astype(
+                previous[column].dtype
+            )
+        
+        # Closest road points follow from the known nearest edges
+        edges = result['nearest_edge'].to_numpy()
+        nearest_roads = np.where(edges >= 0, self.road_proj.values[np.maximum(edges, 0)], None)
+        self.buildings_gdf = result
+        self.buildings_proj = snapshot_proj
+        self.nearest_points = gpd.GeoSeries(
+            shapely.get_point(shapely.shortest_line(building_geoms, nearest_roads), 1),
+            index=result.index, crs=self.crs
+        )
+        
+        metadata['recomputed_buildings'] = int(dirty.sum())
+        path = self.save_results(store, road_id, **metadata)
+        
+        return {'path': path, 'recomputed': int(dirty.sum()), 'total': len(result)}
+    
+    def process_in_chunks(self, building_chunks, output_dir, threshold=30,
+                          mode='distance', reserve_widths=None):
+        """
+        Run distance, classification and export chunk by chunk
+        
+        Each chunk of buildings is analysed against the loaded road network
+        and written straight to a part file of a GeoParquet dataset, so peak
+        memory depends on the chunk size rather than the size of the city.
+        The road index and reserve polygon are built once and shared by all
+        chunks.
+        
+        Parameters:
+        -----------
+        building_chunks : iterable of GeoDataFrame
+            Building footprints, e.g. from ``iter_building_chunks`` or
+            ``pbf_loader.iter_pbf_chunks(path, 'buildings')``
+        output_dir : str
+            Directory receiving one ``part-NNNNN.parquet`` file per chunk
+        threshold, mode, reserve_widths :
+            Passed to ``identify_encroachments``
+        """
+        if self.road_gdf is None:
+            print("Please load road data first")
+            return None
+        
+        from result_store import write_geoparquet
+        
+        os.makedirs(output_dir, exist_ok=True)
+        
+        summary = {'parts': [], 'total_buildings': 0, 'total_encroachments': 0}
+        
+        for i, chunk in enumerate(building_chunks):
+            self.buildings_gdf = chunk
+            self.buildings_proj = None
+            
+            self.calculate_distances()
+            result = self.identify_encroachments(
+                threshold=threshold, mode=mode, reserve_widths=reserve_widths
+            )
+            
+            part_path = os.path.join(output_dir, f"part-{i:05d}.parquet")
+            # Tag columns mixing lists and strings are JSON-encoded, as in the store
+            write_geoparquet(result, part_path)
+            
+            summary['parts'].append(part_path)
+            summary['total_buildings'] += len(result)
+            summary['total_encroachments'] += int(result['is_encroachment'].sum())
+        
+        # Drop the last chunk so nothing city-sized stays referenced
+        self.buildings_gdf = None
+        self.buildings_proj = None
+        self.nearest_points = None
+        
+        return summary
     
     def export_to_geojson(self, output_path='encroachment_data.geojson'):
         """
         Export processed data to GeoJSON format
         """
-        if self.buildings_gdf is not None:
-            self.buildings_gdf.to_file(output_path, driver='GeoJSON')
-            print(f"Data exported to {output_path}")
-        else:
-            print("No data to export")
+        self.export_results(output_path, fmt='geojson')
     
     def export_to_csv(self, output_path='encroachment_data.csv'):
         """
         Export processed data to CSV format
         """
-        if self.buildings_gdf is not None:
-            # Convert to regular DataFrame (without geometry)
-            df = pd.DataFrame(self.buildings_gdf.drop(columns='geometry'))
-            
-            # Add lat/lon columns
-            df['latitude'] = self.buildings_gdf.geometry.centroid.y
-            df['longitude'] = self.buildings_gdf.geometry.centroid.x
-            
-            df.to_csv(output_path, index=False)
-            print(f"Data exported to {output_path}")
-        else:
+        self.export_results(output_path, fmt='csv')
+    
+    @profiled(rows=_building_rows)
+    def export_results(self, output_path, fmt=None, chunk_size=50000):
+        """
+        Stream processed data to CSV, GeoJSON, GeoParquet or FlatGeobuf
+        
+        Parameters:
+        -----------
+        output_path : str
+            Output file; the format follows its extension unless ``fmt`` is set
+        fmt : str
+            'csv', 'geojson', 'parquet' or 'fgb'
+        chunk_size : int
+            Rows converted and written per step
+        """
+        if self.buildings_gdf is None:
             print("No data to export")
+            return None
+        
+        from exporter import export
+        
+        export(self.buildings_gdf, output_path, fmt=fmt, chunk_size=chunk_size)
+        print(f"Data exported to {output_path}")
+        return output_path
     
     def get_summary_statistics(self):
         """
@@ -168,6 +1169,40 @@ class EncroachmentDataLoader:
         return stats
 
 
+def iter_building_chunks(source, chunk_size=50000):
+    """
+    Split building footprints into spatially coherent chunks
+    
+    Parameters:
+    -----------
+    source : GeoDataFrame or str
+        In-memory footprints, which are ordered along a Hilbert curve before
+        slicing so each chunk covers a compact area, or the path to a
+        GeoParquet file, which is read one row group batch at a time
+    chunk_size : int
+        Maximum number of buildings per chunk
+    """
+    if isinstance(source, gpd.GeoDataFrame):
+        if len(source) == 0:
+            return
+        order = np.argsort(source.geometry.hilbert_distance().to_numpy(), kind='stable')
+        for start in range(0, len(source), chunk_size):
+            yield source.iloc[order[start:start + chunk_size]]
+        return
+    
+    import pyarrow.parquet as pq
+    
+    parquet = pq.ParquetFile(source)
+    geo = json.loads(parquet.schema_arrow.metadata[b'geo'])
+    column = geo['primary_column']
+    crs = geo['columns'][column].get('crs', "EPSG:4326")
+    
+    for batch in parquet.iter_batches(batch_size=chunk_size):
+        df = batch.to_pandas()
+        geometry = gpd.GeoSeries.from_wkb(df.pop(column), crs=crs)
+        yield gpd.GeoDataFrame(df, geometry=geometry)
+
+
 def create_sample_data():
     """
     Create sample data for demonstration purposes
@@ -198,12 +1233,8 @@ def create_sample_data():
     # Calculate encroachment status
     df['is_encroachment'] = df['distance_to_road'] < 30
     
-    # Categorize severity
-    df['severity'] = pd.cut(
-        df['distance_to_road'],
-        bins=[0, 10, 20, 30, float('inf')],
-        labels=['Critical', 'High', 'Moderate', 'Compliant']
-    )
+    # Categorize severity against the 30m reserve
+    df['severity'] = classify_severity(df['distance_to_road'], reserve_width=30)
     
     # Add risk scores
     df['risk_score'] = (30 - df['distance_to_road'].clip(0, 30)) / 30 * 100
@@ -211,6 +1242,124 @@ def create_sample_data():
     return df
 
 
+def create_synthetic_city(n_buildings=10000, block=200, arterial_every=5,
+                          center=(-1.2921, 36.8219), crs="EPSG:32737", seed=42):
+    """
+    Create a synthetic road network and building footprints at any scale
+    
+    Unlike ``create_sample_data`` this produces real geometry shaped like
+    osmnx output, so the whole pipeline can be run and timed offline. The
+    city is a street grid whose size grows with ``n_buildings`` at a
+    constant density; every ``arterial_every``-th street is a primary road
+    and the rest are residential. Footprints are rotated rectangles lined
+    up along the streets, set back by an exponential distance so some fall
+    inside the road reserve.
+    
+    Parameters:
+    -----------
+    n_buildings : int
+        Number of building footprints
+    block : float
+        Street spacing in meters
+    arterial_every : int
+        Spacing of primary roads in streets
+    center : tuple
+        (latitude, longitude) the city is centered on
+    crs : str
+        Metric CRS the city is laid out in
+    seed : int
+        Random seed
+    
+    Returns:
+    --------
+    (roads, buildings) GeoDataFrames in EPSG:4326; roads indexed by
+    (u, v, key) with osmid, name and highway, buildings by
+    (element, id) with a building tag, as osmnx 2 returns them
+    """
+    rng = np.random.default_rng(seed)
+    
+    # About 60 buildings per block keeps the density of a dense suburb
+    n_lines = max(2, int(np.ceil(np.sqrt(n_buildings / 60))) + 1)
+    extent = (n_lines - 1) * block
+    origin = gpd.GeoSeries(
+        [Point(center[1], center[0])], crs="EPSG:4326"
+    ).to_crs(crs).iloc[0]
+    x0, y0 = origin.x - extent / 2, origin.y - extent / 2
+    
+    # Grid nodes numbered row by row; one edge per block side
+    ticks = np.arange(n_lines)
+    col, row = np.meshgrid(ticks[:-1], ticks)
+    node = row * n_lines + col
+    u = np.concatenate([node.ravel(), col.ravel() * n_lines + row.ravel()])
+    v = np.concatenate([node.ravel() + 1, (col.ravel() + 1) * n_lines + row.ravel()])
+    line = np.concatenate([row.ravel(), row.ravel()])
+    horizontal = np.arange(len(u)) < node.size
+    
+    def node_xy(n):
+        return x0 + (n % n_lines) * block, y0 + (n // n_lines) * block
+    
+    ux, uy = node_xy(u)
+    vx, vy = node_xy(v)
+    edges = shapely.linestrings(np.stack([np.column_stack([ux, uy]),
+                                          np.column_stack([vx, vy])], axis=1))
+    
+    # Every street is named so chainage runs along one straight line each
+    arterial = line % arterial_every == 0
+    kind = np.where(arterial, np.where(horizontal, 'Road ', 'Avenue '),
+                    np.where(horizontal, 'Street ', 'Lane '))
+    name = np.char.add(np.char.add('Synthetic ', kind), line.astype(str)).astype(object)
+    roads = gpd.GeoDataFrame(
+        {
+            'osmid': np.arange(len(u)) + 1,
+            'name': name,
+            'highway': np.where(arterial, 'primary', 'residential').astype(object),
+        },
+        geometry=edges,
+        crs=crs,
+        index=pd.MultiIndex.from_arrays([u, v, np.zeros(len(u), dtype=np.int64)],
+                                        names=['u', 'v', 'key'])
+    )
+    
+    # Footprints along a random edge, on a random side
+    edge = rng.integers(0, len(u), n_buildings)
+    along = rng.uniform(0.05, 0.95, n_buildings)
+    side = rng.choice([-1.0, 1.0], n_buildings)
+    width = rng.uniform(6, 20, n_buildings)
+    depth = rng.uniform(8, 25, n_buildings)
+    setback = rng.exponential(15, n_buildings) + depth / 2
+    
+    dx = (vx - ux)[edge] / block
+    dy = (vy - uy)[edge] / block
+    cx = ux[edge] + dx * along * block - dy * side * setback
+    cy = uy[edge] + dy * along * block + dx * side * setback
+    
+    # Corners of each rectangle, rotated to face its street
+    corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1], [-1, -1]], dtype=float)
+    local_x = corners[:, 0][None, :] * (width / 2)[:, None]
+    local_y = corners[:, 1][None, :] * (depth / 2)[:, None]
+    ring_x = cx[:, None] + local_x * dx[:, None] - local_y * dy[:, None]
+    ring_y = cy[:, None] + local_x * dy[:, None] + local_y * dx[:, None]
+    footprints = shapely.polygons(np.stack([ring_x, ring_y], axis=-1))
+    
+    buildings = gpd.GeoDataFrame(
+        {
+            'building': rng.choice(
+                ['yes', 'house', 'residential', 'commercial', 'apartments', 'industrial'],
+                n_buildings,
+                p=[0.4, 0.25, 0.15, 0.1, 0.07, 0.03]
+            ).astype(object)
+        },
+        geometry=footprints,
+        crs=crs,
+        index=pd.MultiIndex.from_arrays(
+            [np.full(n_buildings, 'way', dtype=object), np.arange(n_buildings) + 1],
+            names=['element', 'id']
+        )
+    )
+    
+    return roads.to_crs("EPSG:4326"), buildings.to_crs("EPSG:4326")
+
+
 # Example usage
 if __name__ == "__main__":
     print("Encroachment Data Loader - Example Usage")
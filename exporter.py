@@ -0,0 +1,218 @@
+"""
+Exporter
+Chunked export of encroachment results to CSV, GeoJSON, GeoParquet and FlatGeobuf
+
+Rows are converted and written a chunk at a time, so an export never holds
+more than one chunk's text or Arrow buffers in memory, and centroids are
+computed in a single vectorised pass per chunk. Results can be a
+GeoDataFrame or a plain DataFrame with latitude/longitude columns, in which
+case point geometries are built from the coordinates.
+"""
+
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+
+# Output format -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    'csv': ('.csv', 'text/csv'),
+    'geojson': ('.geojson', 'application/geo+json'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'fgb': ('.fgb', 'application/octet-stream'),
+}
+
+
+def iter_chunks(data, chunk_size=50000, lat_column='latitude', lon_column='longitude'):
+    """
+    Yield (attributes, geometries) per chunk of rows
+
+    Attributes are a DataFrame without the geometry column, with centroid
+    latitude/longitude columns added when the input has none; geometries
+    are a shapely array in EPSG:4326 (None entries when the input has no
+    location).
+    """
+    is_geo = isinstance(data, gpd.GeoDataFrame)
+
+    # An empty input still yields one empty chunk so writers get a schema
+    for start in range(0, max(len(data), 1), chunk_size):
+        chunk = data.iloc[start:start + chunk_size]
+
+        if is_geo:
+            geoseries = chunk.geometry
+            if geoseries.crs is not None and not geoseries.crs.equals("EPSG:4326"):
+                geoseries = geoseries.to_crs("EPSG:4326")
+            geometries = geoseries.to_numpy()
+            attributes = pd.DataFrame(chunk.drop(columns=chunk.geometry.name))
+
+            if lat_column not in attributes or lon_column not in attributes:
+                centroids = shapely.centroid(geometries)
+                attributes[lat_column] = shapely.get_y(centroids)
+                attributes[lon_column] = shapely.get_x(centroids)
+        else:
+            attributes = chunk
+            if lat_column in chunk and lon_column in chunk:
+                geometries = shapely.points(
+                    chunk[lon_column].to_numpy(dtype=float),
+                    chunk[lat_column].to_numpy(dtype=float)
+                )
+            else:
+                geometries = np.full(len(chunk), None, dtype=object)
+
+        yield attributes, geometries
+
+
+def _encode_value(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    if value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return str(value)
+
+
+def _encode_objects(attributes):
+    # Lists and dicts from OSM tags do not fit a flat column; store them as JSON
+    attributes = attributes.copy()
+    for column in attributes.columns:
+        if attributes[column].dtype == object:
+            attributes[column] = attributes[column].map(_encode_value)
+    return attributes
+
+
+def iter_csv(data, chunk_size=50000, **columns):
+    """
+    CSV text of the results, one string per chunk (header in the first)
+    """
+    for i, (attributes, _) in enumerate(iter_chunks(data, chunk_size, **columns)):
+        yield attributes.to_csv(index=False, header=(i == 0))
+
+
+def iter_geojson(data, chunk_size=50000, **columns):
+    """
+    GeoJSON FeatureCollection text of the results, one string per chunk
+    """
+    yield '{"type": "FeatureCollection", "features": [\n'
+
+    first = True
+    for attributes, geometries in iter_chunks(data, chunk_size, **columns):
+        properties = json.loads(
+            attributes.to_json(orient='records', date_format='iso', default_handler=str)
+        )
+        geometry_json = shapely.to_geojson(geometries)
+
+        features = ',\n'.join(
+            '{"type": "Feature", "properties": %s, "geometry": %s}'
+            % (json.dumps(props), geometry if geometry is not None else 'null')
+            for props, geometry in zip(properties, geometry_json)
+        )
+        if features:
+            yield features if first else ',\n' + features
+            first = False
+
+    yield '\n]}\n'
+
+
+def write_parquet(data, path, chunk_size=50000, **columns):
+    """
+    Write the results to GeoParquet one row group per chunk
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    geo_metadata = {
+        'version': '1.0.0',
+        'primary_column': 'geometry',
+        'columns': {
+            'geometry': {
+                'encoding': 'WKB',
+                'geometry_types': [],
+                'crs': gpd.GeoSeries(crs="EPSG:4326").crs.to_json_dict()
+            }
+        }
+    }
+
+    writer = None
+    try:
+        for attributes, geometries in iter_chunks(data, chunk_size, **columns):
+            table = pa.Table.from_pandas(_encode_objects(attributes), preserve_index=False)
+            table = table.append_column(
+                'geometry', pa.array(shapely.to_wkb(geometries), type=pa.binary())
+            )
+
+            if writer is None:
+                # Columns that are all null in the first chunk may hold text later
+                schema = pa.schema([
+                    field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                    for field in table.schema
+                ]).with_metadata({
+                    **(table.schema.metadata or {}),
+                    b'geo': json.dumps(geo_metadata).encode()
+                })
+                writer = pq.ParquetWriter(path, schema)
+
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_flatgeobuf(data, path, **columns):
+    """
+    Write the results to FlatGeobuf
+
+    FlatGeobuf stores its spatial index after the features, so GDAL cannot
+    append to an open file; the frame is written in one call.
+    """
+    attributes, geometries = next(iter_chunks(data, max(len(data), 1), **columns))
+    gdf = gpd.GeoDataFrame(
+        _encode_objects(attributes),
+        geometry=gpd.GeoSeries(geometries, index=attributes.index, crs="EPSG:4326")
+    )
+    gdf.to_file(path, driver='FlatGeobuf')
+
+
+def export(data, path, fmt=None, chunk_size=50000, **columns):
+    """
+    Export results to a file, streaming chunks where the format allows
+
+    Parameters:
+    -----------
+    data : DataFrame or GeoDataFrame
+        Results to export
+    path : str
+        Output file
+    fmt : str
+        One of ``EXPORT_FORMATS``; inferred from the file extension if None
+    chunk_size : int
+        Rows converted and written per step
+    columns :
+        ``lat_column``/``lon_column`` if they differ from latitude/longitude
+
+    Returns:
+    --------
+    Path of the written file
+    """
+    if fmt is None:
+        extension = os.path.splitext(path)[1].lower()
+        fmt = next(
+            (name for name, (ext, _) in EXPORT_FORMATS.items() if ext == extension),
+            None
+        )
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format for {path}: {fmt}")
+
+    if fmt == 'parquet':
+        write_parquet(data, path, chunk_size, **columns)
+    elif fmt == 'fgb':
+        write_flatgeobuf(data, path, **columns)
+    else:
+        chunks = iter_csv if fmt == 'csv' else iter_geojson
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            for text in chunks(data, chunk_size, **columns):
+                f.write(text)
+
+    return path
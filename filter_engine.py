@@ -0,0 +1,139 @@
+"""
+Filter Engine
+Bitmap-indexed categorical filters with memoised aggregates
+
+Each filterable column is encoded once as categorical codes and one packed
+bitmap per category. A filter selection resolves by OR-ing the bitmaps of
+the selected values within a column and AND-ing across columns, without
+comparing any strings. The bitmap of a selection and small aggregates
+derived from it (metrics, chart data) are memoised per selection with
+least-recently-used eviction. Filtered rows are materialised per request
+and never cached, so an index shared by every session of a server stays
+small; the cache itself is guarded by a lock.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+class FilterIndex:
+    """
+    Packed bitmaps per category value over a fixed DataFrame
+
+    Parameters:
+    -----------
+    df : DataFrame
+        Rows to filter; the index is built once and reused for every query
+    columns : list of str
+        Categorical columns that can be filtered on
+    cache_size : int
+        Number of selection bitmaps and (aggregate, selection) results kept
+        in the LRU cache
+    """
+
+    def __init__(self, df, columns, cache_size=128):
+        self.df = df
+        self.n_rows = len(df)
+        self.cache_size = cache_size
+        self.categories = {}
+        self.bitmaps = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        for column in columns:
+            codes = pd.Categorical(df[column])
+            self.categories[column] = list(codes.categories)
+            self.bitmaps[column] = {
+                value: np.packbits(codes.codes == code)
+                for code, value in enumerate(codes.categories)
+            }
+
+    def selection_key(self, **selections):
+        """
+        Hashable, order-independent key for a filter selection
+        """
+        return tuple(sorted(
+            (column, tuple(sorted(map(str, values))))
+            for column, values in selections.items()
+        ))
+
+    def _memoised(self, key, compute):
+        """
+        Cached value for ``key``, computed and stored on a miss
+        """
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        # Computed outside the lock so other sessions are not held up
+        value = compute()
+
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return value
+
+    def bits(self, **selections):
+        """
+        Packed bitmap of the rows matching a selection, memoised
+
+        Parameters:
+        -----------
+        selections : column=list of values
+            Rows match if, for every column given, their value is one of the
+            listed values. Columns not given are unfiltered.
+        """
+        def compute():
+            result = np.packbits(np.ones(self.n_rows, dtype=bool))
+            empty = np.zeros_like(result)
+
+            for column, values in selections.items():
+                bitmaps = self.bitmaps[column]
+                selected = [bitmaps[value] for value in values if value in bitmaps]
+                column_bits = np.bitwise_or.reduce(selected) if selected else empty
+                result &= column_bits
+
+            # Shared between sessions, so callers must not modify it
+            result.flags.writeable = False
+            return result
+
+        return self._memoised(('bits', self.selection_key(**selections)), compute)
+
+    def mask(self, **selections):
+        """
+        Boolean row mask for a selection
+        """
+        return np.unpackbits(self.bits(**selections), count=self.n_rows).astype(bool)
+
+    def rows(self, **selections):
+        """
+        Rows matching a selection; materialised on every call, not cached
+        """
+        return self.df[self.mask(**selections)]
+
+    def aggregate(self, name, func, **selections):
+        """
+        Memoised ``func(filtered_df)`` for a selection
+
+        Parameters:
+        -----------
+        name : str
+            Identifies the aggregate; part of the cache key
+        func : callable
+            Receives the filtered rows and returns the aggregate. The result
+            is kept in a cache shared by every session, so it should be small
+            (a metric or chart table), never the rows themselves.
+        selections :
+            Filter selection, as for ``mask``
+        """
+        return self._memoised(
+            (name, self.selection_key(**selections)),
+            lambda: func(self.rows(**selections))
+        )
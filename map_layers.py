@@ -0,0 +1,300 @@
+"""
+Map Layers
+Folium layers built from column arrays for large numbers of buildings
+
+Adding one folium marker per building serialises a separate JavaScript
+object and HTML popup for every row, and even a GeoJSON layer repeats every
+property name per feature. The layer here ships one array per column and
+draws the markers on a shared canvas in the browser; popups are assembled
+from the arrays only when a marker is clicked.
+"""
+
+import folium
+import numpy as np
+import pandas as pd
+import shapely
+from branca.colormap import LinearColormap
+from folium.map import Layer
+from jinja2 import Template
+
+
+SEVERITY_COLORS = {
+    'Critical': 'red',
+    'High': 'orange',
+    'Moderate': 'yellow',
+    'Compliant': 'green'
+}
+
+
+class ColumnarPointLayer(Layer):
+    """
+    Canvas-rendered circle markers fed from column arrays
+
+    Parameters:
+    -----------
+    data : dict
+        ``lat``, ``lon`` and ``color`` (palette index) arrays, plus one array
+        per popup field under ``fields``
+    palette : list of str
+        Marker colors indexed by ``data['color']``
+    popup_aliases : list of str
+        Popup labels, in the order of ``data['fields']``
+    name : str
+        Layer name shown in a folium LayerControl
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = L.featureGroup();
+        (function() {
+            var data = {{ this.data|tojson }};
+            var palette = {{ this.palette|tojson }};
+            var aliases = {{ this.popup_aliases|tojson }};
+            var renderer = L.canvas();
+
+            function escape(value) {
+                return String(value).replace(/[&<>"']/g, function(c) {
+                    return '&#' + c.charCodeAt(0) + ';';
+                });
+            }
+
+            function popup(layer) {
+                var row = layer.options.row;
+                var html = '';
+                for (var f = 0; f < aliases.length; f++) {
+                    html += '<b>' + escape(aliases[f]) + ':</b> '
+                        + escape(data.fields[f][row]) + '<br>';
+                }
+                return html;
+            }
+
+            for (var i = 0; i < data.lat.length; i++) {
+                var color = palette[data.color[i]];
+                L.circleMarker([data.lat[i], data.lon[i]], {
+                    renderer: renderer,
+                    radius: {{ this.radius }},
+                    color: color,
+                    fillColor: color,
+                    fillOpacity: 0.7,
+                    row: i
+                }).bindPopup(popup, {maxWidth: 200}).addTo({{ this.get_name() }});
+            }
+        })();
+        {{ this.get_name() }}.addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, data, palette, popup_aliases, radius=8, name='Buildings'):
+        super().__init__(name=name)
+        self._name = 'ColumnarPointLayer'
+        self.data = data
+        self.palette = palette
+        self.popup_aliases = popup_aliases
+        self.radius = radius
+
+
+def _column_values(series, decimals=1):
+    """
+    JSON-ready values of a column, rounding floats to keep the payload small
+    """
+    if pd.api.types.is_float_dtype(series):
+        return series.to_numpy(dtype=float).round(decimals).tolist()
+    if pd.api.types.is_numeric_dtype(series):
+        return series.tolist()
+    return series.astype(str).tolist()
+
+
+def add_point_layer(m, df, color_column, colors, popup_fields, popup_aliases=None,
+                    radius=8, name='Buildings', default_color='gray'):
+    """
+    Add every row of ``df`` to the map as one canvas-rendered marker layer
+
+    Parameters:
+    -----------
+    m : folium.Map
+        Target map
+    df : DataFrame
+        Rows with latitude/longitude columns
+    color_column : str
+        Column whose value selects the marker color
+    colors : dict
+        Marker color per value of ``color_column``
+    popup_fields : list of str
+        Columns shown in the popup, built in the browser on click
+    popup_aliases : list of str
+        Labels for ``popup_fields``
+    """
+    # Colors travel as small integer codes into a palette
+    values = df[color_column].astype(str).to_numpy()
+    keys = list(colors)
+    codes = np.full(len(values), len(keys), dtype=np.int64)
+    for code, key in enumerate(keys):
+        codes[values == key] = code
+    palette = [colors[key] for key in keys] + [default_color]
+
+    data = {
+        'lat': df['latitude'].to_numpy(dtype=float).round(6).tolist(),
+        'lon': df['longitude'].to_numpy(dtype=float).round(6).tolist(),
+        'color': codes.tolist(),
+        'fields': [_column_values(df[field]) for field in popup_fields],
+    }
+
+    layer = ColumnarPointLayer(
+        data,
+        palette,
+        popup_aliases or popup_fields,
+        radius=radius,
+        name=name
+    )
+    layer.add_to(m)
+
+    return layer
+
+
+class ViewportIndex:
+    """
+    Spatial index over point locations for viewport queries
+
+    The map only receives the points inside the current view. At low zoom
+    levels points that would land on the same few screen pixels are
+    thinned to one, so the payload stays roughly constant however many
+    buildings the dataset holds.
+
+    Parameters:
+    -----------
+    lat, lon : array-like
+        Point coordinates in degrees
+    priority : array-like
+        Optional rank per point, lower first; when points are thinned the
+        lowest-ranked one in each pixel cell is kept (e.g. severity codes
+        so critical cases stay visible)
+    """
+
+    def __init__(self, lat, lon, priority=None):
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.tree = shapely.STRtree(shapely.points(self.lon, self.lat))
+        self.priority = None if priority is None else np.asarray(priority)
+
+    def __len__(self):
+        return len(self.lat)
+
+    def query(self, bounds=None, zoom=12, mask=None, pixel_size=4,
+              max_features=20000):
+        """
+        Positions of the points to draw for a viewport
+
+        Parameters:
+        -----------
+        bounds : tuple
+            (south, west, north, east) of the view; None for everything
+        zoom : int
+            Web map zoom level, which sets the thinning cell size
+        mask : boolean array
+            Optional filter over all points, e.g. from the sidebar filters
+        pixel_size : float
+            Size in screen pixels of the cells points are thinned to
+        max_features : int
+            Hard cap on the number of points returned
+        """
+        if bounds is None:
+            idx = np.arange(len(self))
+        else:
+            south, west, north, east = bounds
+            idx = np.sort(self.tree.query(shapely.box(west, south, east, north)))
+
+        if mask is not None:
+            idx = idx[np.asarray(mask)[idx]]
+
+        if len(idx) == 0:
+            return idx
+
+        # Most important points first so they win their thinning cell
+        if self.priority is not None:
+            idx = idx[np.argsort(self.priority[idx], kind='stable')]
+
+        # Degrees covered by one cell at this zoom (256 px world tiles)
+        cell = pixel_size * 360 / (256 * 2 ** zoom)
+        col = np.floor((self.lon[idx] + 180) / cell).astype(np.int64)
+        row = np.floor((self.lat[idx] + 90) / cell).astype(np.int64)
+        _, first = np.unique(row * (2 ** 31) + col, return_index=True)
+        idx = idx[np.sort(first)][:max_features]
+
+        return np.sort(idx)
+
+
+def viewport_from_map_state(state):
+    """
+    (bounds, zoom) from the dict returned by ``st_folium``, or (None, None)
+    """
+    if not state or not state.get('bounds'):
+        return None, None
+
+    south_west = state['bounds'].get('_southWest') or {}
+    north_east = state['bounds'].get('_northEast') or {}
+    if south_west.get('lat') is None or north_east.get('lat') is None:
+        return None, state.get('zoom')
+
+    bounds = (
+        south_west['lat'], south_west['lng'],
+        north_east['lat'], north_east['lng']
+    )
+    return bounds, state.get('zoom')
+
+
+GRID_TOOLTIP_FIELDS = {
+    'buildings': 'Buildings',
+    'encroachments': 'Encroachments',
+    'critical': 'Critical',
+    'high': 'High',
+    'moderate': 'Moderate',
+    'overlap_area_m2': 'Overlap area (m²)'
+}
+
+
+def add_grid_layer(m, cells, value_column='encroachments', name='Encroachment density'):
+    """
+    Draw grid aggregates as a single choropleth GeoJSON layer
+
+    Parameters:
+    -----------
+    m : folium.Map
+        Target map
+    cells : GeoDataFrame
+        Cells of one size from ``aggregates.build_grid_aggregates``
+    value_column : str
+        Column that sets the fill color
+    """
+    if len(cells) == 0:
+        return None
+
+    colormap = LinearColormap(
+        ['#ffffb2', '#fd8d3c', '#bd0026'],
+        vmin=0,
+        vmax=max(float(cells[value_column].max()), 1),
+        caption=name
+    )
+
+    fields = [field for field in GRID_TOOLTIP_FIELDS if field in cells]
+    if value_column not in fields:
+        fields.insert(0, value_column)
+    cells = cells[fields + [cells.geometry.name]]
+
+    layer = folium.GeoJson(
+        cells,
+        name=name,
+        style_function=lambda feature: {
+            'fillColor': colormap(feature['properties'][value_column]),
+            'color': 'white',
+            'weight': 0.5,
+            'fillOpacity': 0.6
+        },
+        tooltip=folium.GeoJsonTooltip(
+            fields=fields,
+            aliases=[GRID_TOOLTIP_FIELDS.get(field, field) for field in fields]
+        )
+    )
+    layer.add_to(m)
+    colormap.add_to(m)
+
+    return layer
@@ -0,0 +1,158 @@
+"""
+Neighbourhood
+Spatial context features of each building for the risk model
+
+Counts and rates within a radius come from batched STRtree radius queries
+over projected building centroids, and the distance to the nearest other
+encroaching building from one nearest-neighbour query, so the cost grows
+with the number of buildings times their local density rather than with
+the square of the number of buildings. Results can be cached next to a
+stored result version and reused by training and scoring.
+"""
+
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+
+# Radius in meters of the neighbourhood counts and rates
+NEIGHBOURHOOD_RADIUS = 50
+
+# Nearest-encroacher distance reported when none is within this range
+MAX_ENCROACHER_DISTANCE = 1000
+
+NEIGHBOURHOOD_FEATURES = [
+    'neighbour_count', 'local_encroachment_rate', 'nearest_encroacher_m'
+]
+
+
+def compute_neighbourhood_features(x, y, is_encroachment, radius=NEIGHBOURHOOD_RADIUS,
+                                   max_distance=MAX_ENCROACHER_DISTANCE,
+                                   batch_size=50000):
+    """
+    Neighbourhood features from projected building centroids
+
+    Parameters:
+    -----------
+    x, y : array-like
+        Centroid coordinates in a metric CRS
+    is_encroachment : array-like of bool
+        Encroachment flag of each building
+    radius : float
+        Neighbourhood radius in meters
+    max_distance : float
+        Cap and fill value of ``nearest_encroacher_m``
+    batch_size : int
+        Buildings queried per batch, bounding the size of the pair arrays
+
+    Returns:
+    --------
+    DataFrame with, per building and excluding the building itself:
+
+    - neighbour_count: buildings within ``radius``
+    - local_encroachment_rate: share of those that encroach (0 if none)
+    - nearest_encroacher_m: distance to the closest encroaching building
+    """
+    points = shapely.points(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    encroaching = np.asarray(is_encroachment, dtype=bool)
+    n = len(points)
+
+    tree = shapely.STRtree(points)
+    neighbours = np.zeros(n, dtype=np.int64)
+    encroaching_neighbours = np.zeros(n, dtype=np.int64)
+
+    for start in range(0, n, batch_size):
+        batch = points[start:start + batch_size]
+        source, target = tree.query(batch, predicate='dwithin', distance=radius)
+        source = source + start
+
+        other = source != target
+        source, target = source[other], target[other]
+        neighbours += np.bincount(source, minlength=n)
+        encroaching_neighbours += np.bincount(
+            source, weights=encroaching[target], minlength=n
+        ).astype(np.int64)
+
+    rate = np.divide(
+        encroaching_neighbours, neighbours,
+        out=np.zeros(n, dtype=float), where=neighbours > 0
+    )
+
+    # Nearest other encroacher: one nearest query against encroachers only.
+    # Only the building itself is dropped, not other buildings at the same
+    # point, so every tie is returned and self pairs are removed by index.
+    nearest = np.full(n, float(max_distance))
+    encroacher_index = np.flatnonzero(encroaching)
+    if len(encroacher_index):
+        encroacher_tree = shapely.STRtree(points[encroacher_index])
+        # An unbounded search is faster than max_distance; clip afterwards
+        (source, target), distance = encroacher_tree.query_nearest(
+            points, return_distance=True, all_matches=True
+        )
+        other = encroacher_index[target] != source
+        nearest[source[other]] = np.minimum(distance[other], max_distance)
+
+        # Encroachers whose only nearest match was themselves share their
+        # point with no other encroacher, so an exclusive query is exact
+        found = np.zeros(n, dtype=bool)
+        found[source[other]] = True
+        alone = np.flatnonzero(encroaching & ~found)
+        if len(alone):
+            (source, target), distance = encroacher_tree.query_nearest(
+                points[alone], return_distance=True, exclusive=True, all_matches=False
+            )
+            nearest[alone[source]] = np.minimum(distance, max_distance)
+
+    return pd.DataFrame({
+        'neighbour_count': neighbours,
+        'local_encroachment_rate': rate,
+        'nearest_encroacher_m': nearest
+    })
+
+
+def neighbourhood_features(results, radius=NEIGHBOURHOOD_RADIUS, crs="EPSG:32737",
+                           cache_path=None):
+    """
+    Neighbourhood features of a result table, cached per snapshot
+
+    Parameters:
+    -----------
+    results : DataFrame
+        Result table with ``latitude``/``longitude`` and ``is_encroachment``
+    radius : float
+        Neighbourhood radius in meters
+    crs : str
+        Metric CRS the centroids are projected to
+    cache_path : str
+        Optional Parquet file holding the features of this exact result
+        version (e.g. ``ResultStore.feature_cache_path``); read if it
+        matches the row count and radius, written otherwise
+
+    Returns:
+    --------
+    DataFrame of ``NEIGHBOURHOOD_FEATURES`` aligned with ``results``
+    """
+    if cache_path is not None and os.path.exists(cache_path):
+        cached = pd.read_parquet(cache_path)
+        if len(cached) == len(results) and cached.attrs.get('radius') == radius:
+            cached.index = results.index
+            return cached
+
+    points = gpd.GeoSeries(
+        gpd.points_from_xy(results['longitude'], results['latitude']), crs="EPSG:4326"
+    ).to_crs(crs)
+    features = compute_neighbourhood_features(
+        points.x.to_numpy(), points.y.to_numpy(),
+        results['is_encroachment'].to_numpy(dtype=bool),
+        radius=radius
+    )
+
+    if cache_path is not None:
+        features.attrs['radius'] = radius
+        features.to_parquet(cache_path, index=False)
+
+    features.index = results.index
+    return features
@@ -0,0 +1,183 @@
+"""
+OSM Download Cache
+Content-addressed on-disk cache for OpenStreetMap road networks and buildings
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import geopandas as gpd
+import osmnx as ox
+
+from result_store import write_geoparquet
+
+
+class CacheMiss(LookupError):
+    """
+    Raised in offline mode when a request is not available on disk
+    """
+
+
+class OSMCache:
+    """
+    Cache OSM downloads on disk, keyed by the query that produced them
+
+    Road networks are stored as GraphML and building footprints as
+    GeoParquet. Entries older than the TTL are refreshed when online, but
+    are still served if the download fails or the cache is offline. The
+    least recently used entries are evicted once the cache exceeds its size
+    budget.
+
+    Parameters:
+    -----------
+    cache_dir : str
+        Directory holding the cached files
+    ttl_days : float
+        Age after which an entry is downloaded again
+    max_size_mb : float
+        Size budget for the cache directory
+    offline : bool
+        Never contact Overpass; defaults to the ENCROACHMENT_OFFLINE
+        environment variable
+    fixture_dir : str
+        Read-only directory checked before the cache, laid out with the same
+        file names. Tests point this at checked-in fixtures.
+    """
+
+    def __init__(self, cache_dir='.osm_cache', ttl_days=30, max_size_mb=2048,
+                 offline=None, fixture_dir=None):
+        self.cache_dir = cache_dir
+        self.ttl = ttl_days * 86400
+        self.max_size = max_size_mb * 1024 * 1024
+        if offline is None:
+            offline = os.environ.get('ENCROACHMENT_OFFLINE', '') not in ('', '0')
+        self.offline = offline
+        self.fixture_dir = fixture_dir
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(kind, place_name, **params):
+        """
+        Stable content address for a query
+        """
+        payload = json.dumps(
+            {'kind': kind, 'place': place_name, 'params': params},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def get_graph(self, place_name, network_type, download):
+        """
+        Road network graph for a place, downloading it on a cache miss
+
+        Parameters:
+        -----------
+        place_name : str
+            Place query passed to osmnx
+        network_type : str
+            osmnx network type, part of the cache key
+        download : callable
+            Zero-argument function returning the graph from Overpass
+        """
+        key = self.make_key('graph', place_name, network_type=network_type)
+        return self._fetch(
+            f"{key}.graphml",
+            load=ox.load_graphml,
+            save=lambda G, path: ox.save_graphml(G, filepath=path),
+            download=download,
+            description=f"{network_type} network for {place_name}"
+        )
+
+    def get_geometries(self, place_name, tags, download):
+        """
+        Feature GeoDataFrame for a place and tag filter
+
+        Parameters:
+        -----------
+        place_name : str
+            Place query passed to osmnx
+        tags : dict
+            OSM tag filter, part of the cache key
+        download : callable
+            Zero-argument function returning the features from Overpass
+        """
+        key = self.make_key('geometries', place_name, tags=tags)
+        return self._fetch(
+            f"{key}.parquet",
+            load=gpd.read_parquet,
+            save=write_geoparquet,
+            download=download,
+            description=f"features {tags} for {place_name}"
+        )
+
+    def _fetch(self, filename, load, save, download, description):
+        # Fixtures stand in for Overpass and are never written to
+        if self.fixture_dir is not None:
+            fixture = os.path.join(self.fixture_dir, filename)
+            if os.path.exists(fixture):
+                return load(fixture)
+
+        path = os.path.join(self.cache_dir, filename)
+        cached = os.path.exists(path)
+
+        if cached and (self.offline or time.time() - os.path.getmtime(path) < self.ttl):
+            # Record the access for least-recently-used eviction
+            os.utime(path, (time.time(), os.path.getmtime(path)))
+            return load(path)
+
+        if self.offline:
+            raise CacheMiss(f"{description} is not cached and offline mode is on")
+
+        try:
+            data = download()
+        except Exception as e:
+            if not cached:
+                raise
+            print(f"Download failed ({e}); using stale cache for {description}")
+            return load(path)
+
+        # Write atomically so an interrupted run never leaves a partial entry
+        tmp_path = f"{path}.tmp"
+        save(data, tmp_path)
+        os.replace(tmp_path, path)
+
+        self.evict()
+
+        return data
+
+    def size(self):
+        """
+        Total size of the cached files in bytes
+        """
+        return sum(size for _, _, size in self._entries())
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits its budget
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+
+        for path, _, size in entries:
+            if total <= self.max_size:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        """
+        Remove every cached entry
+        """
+        for path, _, _ in self._entries():
+            os.remove(path)
+
+    def _entries(self):
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if os.path.isfile(path) and not name.endswith('.tmp'):
+                stat = os.stat(path)
+                yield path, stat.st_atime, stat.st_size
@@ -0,0 +1,243 @@
+"""
+Profiling
+Stage-level timing and memory instrumentation of the analysis pipeline
+
+Every stage records its wall time, CPU time, rows processed and the change
+in resident memory. Stages nest: a loader method is recorded as a whole and
+the sub-steps inside it (downloads, the reserve union, severity
+classification, writes) as children, so a slow run shows where the time
+went. Records export as JSON or in the Prometheus text exposition format.
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def current_rss_mb():
+    """
+    Resident set size of this process in MiB, or None if unavailable
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / 2 ** 20
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process so far in MiB, or None if unavailable
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+
+class StageProfiler:
+    """
+    Records of timed pipeline stages
+
+    Parameters:
+    -----------
+    enabled : bool
+        When False stages run without being measured or recorded
+    max_records : int
+        Number of most recent stage records kept; older ones are dropped so
+        long chunked runs stay bounded
+
+    Nesting is tracked per thread, so one profiler can be shared by the
+    sessions of a server.
+    """
+
+    def __init__(self, enabled=True, max_records=10000):
+        self.enabled = enabled
+        self.records = deque(maxlen=max_records)
+        self._local = threading.local()
+
+    @property
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """
+        Time the enclosed block as one stage
+
+        Yields the stage's record, so the block can set ``record['rows']``
+        once it knows how many rows it processed.
+
+        Parameters:
+        -----------
+        name : str
+            Stage name, e.g. 'calculate_distances' or 'reserve_union'
+        rows : int
+            Rows processed, if known up front
+        """
+        record = {'stage': name, 'rows': rows}
+        if not self.enabled:
+            yield record
+            return
+
+        record.update(
+            parent=self._stack[-1]['stage'] if self._stack else None,
+            depth=len(self._stack),
+            started=datetime.now().isoformat(timespec='milliseconds'),
+        )
+        self._stack.append(record)
+        rss_before = current_rss_mb()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = time.perf_counter() - wall_start
+            record['cpu_seconds'] = time.process_time() - cpu_start
+            rss_after = current_rss_mb()
+            record['memory_delta_mb'] = (
+                rss_after - rss_before
+                if rss_before is not None and rss_after is not None else None
+            )
+            record['peak_rss_mb'] = peak_rss_mb()
+            self._stack.pop()
+            self.records.append(record)
+
+    def reset(self):
+        """
+        Drop all records
+        """
+        self.records.clear()
+
+    def to_frame(self):
+        """
+        One row per recorded stage run, in completion order
+        """
+        return pd.DataFrame(list(self.records), columns=[
+            'stage', 'parent', 'depth', 'started', 'rows', 'wall_seconds',
+            'cpu_seconds', 'memory_delta_mb', 'peak_rss_mb'
+        ])
+
+    def summary(self):
+        """
+        Totals per stage: calls, wall and CPU seconds, rows, rows per second,
+        summed memory delta and the highest peak RSS seen at its end
+        """
+        records = self.to_frame()
+        summary = records.groupby('stage', sort=False).agg(
+            calls=('stage', 'size'),
+            wall_seconds=('wall_seconds', 'sum'),
+            cpu_seconds=('cpu_seconds', 'sum'),
+            rows=('rows', lambda rows: rows.sum(min_count=1)),
+            memory_delta_mb=('memory_delta_mb', lambda delta: delta.sum(min_count=1)),
+            peak_rss_mb=('peak_rss_mb', 'max'),
+        )
+        summary['rows_per_second'] = (
+            summary['rows'] / summary['wall_seconds'].where(summary['wall_seconds'] > 0)
+        )
+        return summary.sort_values('wall_seconds', ascending=False)
+
+    def to_json(self, path=None):
+        """
+        Records and per-stage totals as JSON text, also written to ``path`` if given
+        """
+        summary = self.summary().reset_index()
+        text = json.dumps({
+            'summary': json.loads(summary.to_json(orient='records')),
+            'stages': json.loads(self.to_frame().to_json(orient='records')),
+        }, indent=2)
+
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def to_prometheus(self, prefix='encroachment'):
+        """
+        Per-stage totals in the Prometheus text exposition format
+        """
+        summary = self.summary()
+        metrics = [
+            ('stage_calls_total', 'counter', 'Number of times the stage ran', 'calls', 1),
+            ('stage_wall_seconds_total', 'counter', 'Wall time spent in the stage',
+             'wall_seconds', 1),
+            ('stage_cpu_seconds_total', 'counter', 'CPU time spent in the stage',
+             'cpu_seconds', 1),
+            ('stage_rows_total', 'counter', 'Rows processed by the stage', 'rows', 1),
+            ('stage_memory_delta_bytes', 'gauge',
+             'Summed change in resident memory across the stage', 'memory_delta_mb', 2 ** 20),
+        ]
+
+        lines = []
+        for name, kind, description, column, scale in metrics:
+            lines.append(f"# HELP {prefix}_{name} {description}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for stage, value in summary[column].items():
+                if pd.isna(value):
+                    continue
+                label = str(stage).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                lines.append(f'{prefix}_{name}{{stage="{label}"}} {float(value) * scale!r}')
+
+        peak = peak_rss_mb()
+        if peak is not None:
+            lines.append(f"# HELP {prefix}_peak_rss_bytes Peak resident memory of the process")
+            lines.append(f"# TYPE {prefix}_peak_rss_bytes gauge")
+            lines.append(f"{prefix}_peak_rss_bytes {float(peak * 2 ** 20)!r}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def profiled(name=None, rows=None):
+    """
+    Record every call of a method as a stage of ``self.profiler``
+
+    Parameters:
+    -----------
+    name : str
+        Stage name (default: the method name)
+    rows : callable
+        Called with the instance after the method returns to count the
+        rows it processed
+    """
+    def decorator(method):
+        stage_name = name or method.__name__
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            profiler = getattr(self, 'profiler', None)
+            if profiler is None:
+                return method(self, *args, **kwargs)
+
+            with profiler.stage(stage_name) as record:
+                result = method(self, *args, **kwargs)
+                if rows is not None and record.get('rows') is None:
+                    record['rows'] = rows(self)
+            return result
+
+        return wrapper
+
+    return decorator
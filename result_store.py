@@ -0,0 +1,426 @@
+"""
+Result Store
+On-disk store of per-road encroachment results shared by the pipeline and the app
+
+Each analysed road is written as a versioned GeoParquet file next to a
+small JSON manifest. A road counts as analysed once it has an entry in the
+manifest. Alongside it goes a compact copy of the columns the app needs,
+with categorical codes, float32 metrics and no geometry, as an uncompressed
+Arrow file that readers memory-map without copying.
+Dated snapshots keep only the keys and segments of encroaching buildings,
+one small sorted file per date, so years of history stay cheap to load.
+"""
+
+import json
+import os
+from datetime import datetime
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from severity import SEVERITY_LABELS
+
+
+# Bumped when the layout of the manifest or result files changes
+STORE_VERSION = 1
+
+# Compact result schema: the columns the app and models read, by dtype.
+# Location is kept as float64 latitude/longitude instead of geometries.
+COMPACT_CATEGORICAL = ('element_type', 'name', 'building', 'road_class', 'road_name')
+COMPACT_FLOAT32 = (
+    'distance_to_road', 'distance_meters', 'reserve_width_m', 'area_m2',
+    'overlap_area_m2', 'intrusion_depth_m', 'chainage_m'
+)
+COMPACT_INT32 = ('nearest_edge', 'segment')
+COMPACT_COLUMNS = (
+    ('element_type', 'osmid') + COMPACT_CATEGORICAL[1:] + ('severity', 'is_encroachment')
+    + COMPACT_FLOAT32 + COMPACT_INT32 + ('latitude', 'longitude')
+)
+
+# Major roads in Nairobi, keyed by name
+ROAD_REGISTRY = {
+    "Outer Ring Road": {"id": "ORR-001"},
+    "Thika Road": {"id": "THK-002"},
+    "Mombasa Road": {"id": "MOM-003"},
+    "Waiyaki Way": {"id": "WAY-004"},
+    "Uhuru Highway": {"id": "UHU-005"},
+    "Jogoo Road": {"id": "JOG-006"},
+    "Ngong Road": {"id": "NGO-007"},
+    "Kiambu Road": {"id": "KIA-008"}
+}
+
+
+class ResultStore:
+    """
+    Read and write per-road result datasets and their manifest
+
+    Parameters:
+    -----------
+    root : str
+        Directory holding ``manifest.json`` and one file per road
+    """
+
+    def __init__(self, root='results'):
+        self.root = root
+        self.manifest_path = os.path.join(root, 'manifest.json')
+
+    def read_manifest(self):
+        """
+        Manifest contents, or an empty manifest if nothing was written yet
+        """
+        if not os.path.exists(self.manifest_path):
+            return {'store_version': STORE_VERSION, 'roads': {}}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def has_road(self, road_id):
+        """
+        Whether precomputed results exist for a road
+        """
+        entry = self.get_entry(road_id)
+        return entry is not None and os.path.exists(
+            os.path.join(self.root, entry['path'])
+        )
+
+    def get_entry(self, road_id):
+        """
+        Manifest entry of the latest version of a road, or None
+        """
+        return self.read_manifest()['roads'].get(road_id)
+
+    def write_road(self, road_id, road_name, gdf, aggregates=None, cube=None, edges=None,
+                   **metadata):
+        """
+        Write a new version of one road's results and record it
+
+        Earlier versions stay on disk; the manifest points at the latest and
+        keeps the summary of the previous one for change deltas.
+
+        Parameters:
+        -----------
+        road_id : str
+            Registry id, e.g. 'ORR-001'
+        road_name : str
+            Human-readable road name
+        gdf : GeoDataFrame
+            Output of ``EncroachmentDataLoader.identify_encroachments``
+        aggregates : GeoDataFrame
+            Optional grid aggregates stored alongside this version
+        cube : DataFrame
+            Optional analytics cube stored alongside this version
+        edges : GeoDataFrame
+            Optional road edge table that ``nearest_edge`` positions refer
+            to, used to diff the next snapshot against this one
+        metadata :
+            Extra fields stored with the manifest entry (threshold, mode...)
+        """
+        manifest = self.read_manifest()
+        previous = manifest['roads'].get(road_id)
+        version = previous['version'] + 1 if previous else 1
+
+        os.makedirs(os.path.join(self.root, road_id), exist_ok=True)
+        filename = os.path.join(road_id, f"v{version:04d}.parquet")
+        write_geoparquet(gdf, os.path.join(self.root, filename))
+
+        if 'latitude' in gdf and 'longitude' in gdf:
+            table_filename = os.path.join(road_id, f"v{version:04d}.arrow")
+            write_arrow(compact_results(gdf), os.path.join(self.root, table_filename))
+            metadata['table_path'] = table_filename
+
+        if aggregates is not None:
+            aggregates_filename = os.path.join(road_id, f"v{version:04d}.aggregates.parquet")
+            aggregates.to_parquet(os.path.join(self.root, aggregates_filename))
+            metadata['aggregates_path'] = aggregates_filename
+
+        if cube is not None:
+            cube_filename = os.path.join(road_id, f"v{version:04d}.cube.parquet")
+            cube.to_parquet(os.path.join(self.root, cube_filename), index=False)
+            metadata['cube_path'] = cube_filename
+
+        if edges is not None:
+            edges_filename = os.path.join(road_id, f"v{version:04d}.edges.parquet")
+            edges.to_parquet(os.path.join(self.root, edges_filename))
+            metadata['edges_path'] = edges_filename
+
+        entry = {
+            'name': road_name,
+            'version': version,
+            'path': filename,
+            'total_buildings': int(len(gdf)),
+            'total_encroachments': int(gdf['is_encroachment'].sum()),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            **metadata
+        }
+        if previous:
+            entry['previous'] = {
+                key: previous[key]
+                for key in ('version', 'total_buildings', 'total_encroachments')
+            }
+
+        manifest['store_version'] = STORE_VERSION
+        manifest['roads'][road_id] = entry
+        self._write_manifest(manifest)
+
+        return os.path.join(self.root, filename)
+
+    def load_road(self, road_id):
+        """
+        Load a road's results as a GeoDataFrame
+        """
+        entry = self.get_entry(road_id)
+        return gpd.read_parquet(os.path.join(self.root, entry['path']))
+
+    def load_aggregates(self, road_id):
+        """
+        Grid aggregates of a road's latest results, or None if not stored
+        """
+        entry = self.get_entry(road_id)
+        if 'aggregates_path' not in entry:
+            return None
+        return gpd.read_parquet(os.path.join(self.root, entry['aggregates_path']))
+
+    def load_cube(self, road_id):
+        """
+        Analytics cube of a road's latest results, or None if not stored
+        """
+        entry = self.get_entry(road_id)
+        if 'cube_path' not in entry:
+            return None
+        return pd.read_parquet(os.path.join(self.root, entry['cube_path']))
+
+    def load_edges(self, road_id):
+        """
+        Road edge table of a road's latest results, or None if not stored
+        """
+        entry = self.get_entry(road_id)
+        if 'edges_path' not in entry:
+            return None
+        return gpd.read_parquet(os.path.join(self.root, entry['edges_path']))
+
+    def feature_cache_path(self, road_id):
+        """
+        Cache file for derived per-building features of a road's latest version
+        """
+        path = self.get_entry(road_id)['path']
+        return os.path.join(self.root, path.replace('.parquet', '.features.parquet'))
+
+    def load_table(self, road_id, columns=None):
+        """
+        Memory-map a road's latest results as an Arrow table
+
+        Parameters:
+        -----------
+        road_id : str
+            Registry id
+        columns : list of str
+            Columns to read (default: all except the geometry)
+        """
+        import pyarrow.parquet as pq
+
+        path = os.path.join(self.root, self.get_entry(road_id)['path'])
+        if columns is None:
+            schema = pq.read_schema(path)
+            geo = json.loads(schema.metadata[b'geo'])
+            columns = [name for name in schema.names if name != geo['primary_column']]
+
+        return pq.read_table(path, columns=columns, memory_map=True)
+
+    def load_results(self, road_id, columns=None):
+        """
+        A road's latest results in the compact schema
+
+        Memory-maps the version's Arrow file, so numeric columns without
+        nulls are views of the file rather than copies and the pages are
+        shared by every process reading the same version. Versions written
+        before the Arrow file existed are read from GeoParquet and converted.
+
+        Parameters:
+        -----------
+        road_id : str
+            Registry id
+        columns : list of str
+            Columns to read (default: all of ``COMPACT_COLUMNS`` stored)
+
+        Returns:
+        --------
+        DataFrame, see ``compact_results``
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        entry = self.get_entry(road_id)
+        if 'table_path' in entry:
+            source = pa.memory_map(os.path.join(self.root, entry['table_path']))
+            table = pa.ipc.open_file(source).read_all()
+        else:
+            path = os.path.join(self.root, entry['path'])
+            stored = pq.read_schema(path).names
+            table = pq.read_table(
+                path, columns=[name for name in COMPACT_COLUMNS if name in stored],
+                memory_map=True
+            )
+
+        if columns is not None:
+            table = table.select([name for name in columns if name in table.column_names])
+
+        return compact_results(table.to_pandas(split_blocks=True, self_destruct=True))
+
+    def write_snapshot(self, road_id, date, keys, segments, road_names=None):
+        """
+        Record which buildings encroach on a road at a given date
+
+        Parameters:
+        -----------
+        road_id : str
+            Registry id
+        date : str or datetime
+            Snapshot date; writing the same date again replaces it
+        keys : array of uint64
+            ``data_loader.feature_keys`` of the encroaching buildings
+        segments : array of int
+            Road segment of each building
+        road_names : array of str
+            Road each building's segment counts along; segment numbers
+            restart on every road, so (road_name, segment) is the key
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        date = pd.Timestamp(date).normalize()
+        order = np.argsort(keys, kind='stable')
+        if road_names is None:
+            road_names = np.full(len(order), None, dtype=object)
+        road_names = pd.Series(np.asarray(road_names, dtype=object)[order])
+        table = pa.table({
+            'building_key': pa.array(np.asarray(keys, dtype=np.uint64)[order]),
+            'road_name': pa.array(
+                road_names.fillna('unknown').astype(str).to_numpy(dtype=object),
+                type=pa.string()
+            ).dictionary_encode(),
+            'segment': pa.array(np.asarray(segments, dtype=np.int32)[order]),
+        })
+
+        directory = os.path.join(self.root, road_id, 'snapshots')
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{date:%Y-%m-%d}.parquet")
+        pq.write_table(table, f"{path}.tmp", compression='zstd')
+        os.replace(f"{path}.tmp", path)
+
+        return path
+
+    def load_snapshots(self, road_id):
+        """
+        All snapshots of a road as one DataFrame sorted by date and key
+
+        Columns: date, building_key, road_name, segment; road_name is
+        'unknown' in snapshots written before it was recorded. Empty when
+        none were written.
+        """
+        import pyarrow.parquet as pq
+
+        directory = os.path.join(self.root, road_id, 'snapshots')
+        files = sorted(
+            name for name in os.listdir(directory) if name.endswith('.parquet')
+        ) if os.path.isdir(directory) else []
+
+        frames = []
+        for name in files:
+            frame = pq.read_table(os.path.join(directory, name), memory_map=True).to_pandas()
+            frame.insert(0, 'date', pd.Timestamp(name[:-len('.parquet')]))
+            if 'road_name' not in frame:
+                frame.insert(2, 'road_name', 'unknown')
+            frame['road_name'] = frame['road_name'].astype(object)
+            frames.append(frame)
+
+        if not frames:
+            return pd.DataFrame({
+                'date': pd.Series(dtype='datetime64[ns]'),
+                'building_key': pd.Series(dtype=np.uint64),
+                'road_name': pd.Series(dtype=object),
+                'segment': pd.Series(dtype=np.int32)
+            })
+        snapshots = pd.concat(frames, ignore_index=True)
+        snapshots['road_name'] = snapshots['road_name'].astype('category')
+        return snapshots
+
+    def _write_manifest(self, manifest):
+        # Replace atomically so readers never see a half-written manifest
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+
+def compact_results(results):
+    """
+    Result table reduced to ``COMPACT_COLUMNS`` in compact dtypes
+
+    Severity, OSM type, road class and names become categoricals, metrics
+    float32 and edge/segment positions int32; columns not in the schema,
+    including the geometry, are dropped. Columns already in their compact
+    dtype are not copied.
+    """
+    compact = {}
+    for column in COMPACT_COLUMNS:
+        if column not in results:
+            continue
+        values = results[column]
+
+        if column == 'severity':
+            if not (isinstance(values.dtype, pd.CategoricalDtype)
+                    and tuple(values.cat.categories) == SEVERITY_LABELS):
+                values = pd.Categorical(
+                    values.astype(object), categories=list(SEVERITY_LABELS), ordered=True
+                )
+        elif column in COMPACT_CATEGORICAL:
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                # Merged OSM ways can carry lists; keep them as JSON text
+                values = values.map(
+                    lambda v: json.dumps(v) if isinstance(v, (list, dict)) else v
+                ).astype('category')
+        elif column in COMPACT_FLOAT32 and values.dtype != np.float32:
+            values = values.astype(np.float32)
+        elif column in COMPACT_INT32 and values.dtype != np.int32:
+            values = values.astype(np.int32)
+        elif column == 'is_encroachment' and values.dtype != bool:
+            values = values.astype(bool)
+
+        compact[column] = values
+
+    # No copy: columns read from a memory-mapped file keep pointing into it
+    frame = pd.DataFrame(compact, copy=False)
+    frame.index = pd.RangeIndex(len(frame))
+    return frame
+
+
+def write_arrow(df, path):
+    """
+    Write a DataFrame as an uncompressed Arrow IPC file for memory-mapped reads
+    """
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def write_geoparquet(gdf, path):
+    """
+    Write a GeoDataFrame of OSM features to GeoParquet
+
+    OSM tag columns can mix scalars with lists (e.g. merged ways), which
+    Arrow cannot store in one column, so those values are JSON-encoded.
+    """
+    gdf = gdf.copy()
+    for column in gdf.columns:
+        if column == gdf.geometry.name or gdf[column].dtype != object:
+            continue
+        if gdf[column].map(lambda v: isinstance(v, (list, dict))).any():
+            gdf[column] = gdf[column].map(
+                lambda v: json.dumps(v) if isinstance(v, (list, dict)) else v
+            )
+    gdf.to_parquet(path)
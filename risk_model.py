@@ -0,0 +1,293 @@
+"""
+Risk Model
+Random forest classifier predicting encroachment from building features
+
+The model is trained on stored results, evaluated on a held-out split and
+saved as a versioned artifact with its metrics, so the app only loads it.
+Scoring takes a whole feature table at once.
+
+The label is the pipeline's own rule (distance below the reserve width of
+the nearest road's class), so the distance, reserve width and road class
+are left out of the features: with them the forest just relearns the rule
+and scores perfectly. The model instead rates how much a building's
+footprint and surroundings resemble those of encroaching buildings.
+
+Usage:
+    python risk_model.py --results results --models models
+"""
+
+import argparse
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from neighbourhood import NEIGHBOURHOOD_FEATURES, neighbourhood_features
+
+
+NUMERIC_FEATURES = ['area_m2'] + NEIGHBOURHOOD_FEATURES
+CATEGORICAL_FEATURES = ['building_type']
+FEATURE_LABELS = {
+    'area_m2': 'Building Area',
+    'neighbour_count': 'Neighbourhood Density',
+    'local_encroachment_rate': 'Local Encroachment Rate',
+    'nearest_encroacher_m': 'Distance to Nearest Encroacher',
+    'building_type': 'Building Type'
+}
+
+# Inputs of the encroachment rule itself, never used as features
+LABEL_FEATURES = ('distance_m', 'reserve_width_m', 'road_class')
+
+# Probability cut-offs of the reported risk levels
+RISK_LEVELS = ((0.7, 'HIGH'), (0.3, 'MODERATE'), (0.0, 'LOW'))
+
+
+def build_features(results, crs="EPSG:32737", cache_path=None):
+    """
+    Model features of every building in a result table
+
+    Parameters:
+    -----------
+    results : DataFrame
+        Result table from ``EncroachmentDataLoader.get_result_table`` or
+        the result store
+    crs : str
+        Metric CRS used for the neighbourhood features
+    cache_path : str
+        Optional cache file of the neighbourhood features, see
+        ``neighbourhood.neighbourhood_features``
+
+    Returns:
+    --------
+    DataFrame with ``NUMERIC_FEATURES`` and ``CATEGORICAL_FEATURES``
+    """
+    def text(column):
+        if column not in results:
+            return np.full(len(results), 'unknown', dtype=object)
+        # Stored results hold these as categoricals; map plain values
+        return results[column].astype(object).map(
+            lambda v: v[0] if isinstance(v, list) else v
+        ).fillna('unknown').astype(str).to_numpy()
+
+    features = pd.DataFrame({
+        'area_m2': results['area_m2'].to_numpy(dtype=float),
+    }, index=results.index)
+
+    neighbourhood = neighbourhood_features(results, crs=crs, cache_path=cache_path)
+    for column in NEIGHBOURHOOD_FEATURES:
+        features[column] = neighbourhood[column].to_numpy(dtype=float)
+
+    features['building_type'] = text('building')
+
+    return features
+
+
+def make_pipeline(n_estimators=200, seed=42):
+    """
+    One-hot encoding of the categorical features followed by a random forest
+    """
+    from sklearn.compose import ColumnTransformer
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.impute import SimpleImputer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+
+    preprocess = ColumnTransformer([
+        ('numeric', SimpleImputer(strategy='median'), NUMERIC_FEATURES),
+        ('categorical', OneHotEncoder(handle_unknown='ignore', min_frequency=5),
+         CATEGORICAL_FEATURES),
+    ])
+    forest = RandomForestClassifier(
+        n_estimators=n_estimators,
+        min_samples_leaf=2,
+        class_weight='balanced',
+        n_jobs=-1,
+        random_state=seed
+    )
+    return Pipeline([('preprocess', preprocess), ('forest', forest)])
+
+
+def feature_importances(model):
+    """
+    Forest importances summed back onto the original feature columns
+    """
+    names = model.named_steps['preprocess'].get_feature_names_out()
+    importances = model.named_steps['forest'].feature_importances_
+
+    totals = {}
+    for name, importance in zip(names, importances):
+        # 'numeric__area_m2', 'categorical__building_type_house', ...
+        column = name.split('__', 1)[1]
+        feature = next(f for f in NUMERIC_FEATURES + CATEGORICAL_FEATURES
+                       if column == f or column.startswith(f + '_'))
+        totals[feature] = totals.get(feature, 0.0) + float(importance)
+
+    return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+def train_model(features, labels, test_size=0.2, seed=42, n_estimators=200):
+    """
+    Fit the classifier and evaluate it on a stratified held-out split
+
+    Parameters:
+    -----------
+    features : DataFrame
+        Output of ``build_features``
+    labels : array-like of bool
+        ``is_encroachment`` of each building
+    test_size : float
+        Fraction of buildings held out for the metrics
+
+    Returns:
+    --------
+    (model, info) where info holds the held-out metrics, confusion matrix,
+    feature importances and the categories seen in training
+    """
+    from sklearn import metrics
+    from sklearn.model_selection import train_test_split
+
+    labels = np.asarray(labels, dtype=bool)
+    X_train, X_test, y_train, y_test = train_test_split(
+        features, labels, test_size=test_size, random_state=seed,
+        stratify=labels if 0 < labels.sum() < len(labels) else None
+    )
+
+    model = make_pipeline(n_estimators=n_estimators, seed=seed)
+    model.fit(X_train, y_train)
+
+    probability = score(model, X_test)
+    predicted = probability >= 0.5
+    has_both = len(np.unique(y_test)) == 2
+
+    info = {
+        'algorithm': 'RandomForestClassifier',
+        'features': NUMERIC_FEATURES + CATEGORICAL_FEATURES,
+        'categories': {
+            column: sorted(features[column].unique().tolist())
+            for column in CATEGORICAL_FEATURES
+        },
+        'n_train': int(len(y_train)),
+        'n_test': int(len(y_test)),
+        'metrics': {
+            'accuracy': float(metrics.accuracy_score(y_test, predicted)),
+            'precision': float(metrics.precision_score(y_test, predicted, zero_division=0)),
+            'recall': float(metrics.recall_score(y_test, predicted, zero_division=0)),
+            'f1': float(metrics.f1_score(y_test, predicted, zero_division=0)),
+            'roc_auc': float(metrics.roc_auc_score(y_test, probability)) if has_both else None,
+        },
+        'confusion_matrix': metrics.confusion_matrix(
+            y_test, predicted, labels=[False, True]
+        ).tolist(),
+        'feature_importances': feature_importances(model),
+    }
+
+    return model, info
+
+
+def score(model, features):
+    """
+    Encroachment probability of every row of a feature table
+    """
+    # Columns the artifact was trained on, so older versions keep scoring
+    probability = model.predict_proba(features[list(model.feature_names_in_)])
+    classes = list(model.classes_)
+    if True not in classes:
+        return np.zeros(len(features))
+    return probability[:, classes.index(True)]
+
+
+def risk_levels(probability):
+    """
+    HIGH / MODERATE / LOW label of each probability
+    """
+    probability = np.asarray(probability, dtype=float)
+    levels = np.full(len(probability), RISK_LEVELS[-1][1], dtype=object)
+    for cutoff, level in reversed(RISK_LEVELS[:-1]):
+        levels[probability >= cutoff] = level
+    return levels
+
+
+def save_model(model, info, model_dir='models'):
+    """
+    Write a new model version and point ``latest.json`` at it
+
+    Returns:
+    --------
+    Path of the written artifact
+    """
+    import joblib
+
+    os.makedirs(model_dir, exist_ok=True)
+    latest = read_model_info(model_dir)
+    version = latest['version'] + 1 if latest else 1
+
+    filename = f"encroachment_rf_v{version:04d}.joblib"
+    joblib.dump(model, os.path.join(model_dir, filename))
+
+    info = {**info, 'version': version, 'path': filename,
+            'created': datetime.now().isoformat(timespec='seconds')}
+    with open(os.path.join(model_dir, f"encroachment_rf_v{version:04d}.json"), 'w') as f:
+        json.dump(info, f, indent=2)
+
+    # Replace atomically so the app never reads a half-written pointer
+    tmp_path = os.path.join(model_dir, 'latest.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(info, f, indent=2)
+    os.replace(tmp_path, os.path.join(model_dir, 'latest.json'))
+
+    return os.path.join(model_dir, filename)
+
+
+def read_model_info(model_dir='models'):
+    """
+    Metadata of the latest model version, or None if none was trained
+    """
+    path = os.path.join(model_dir, 'latest.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_model(model_dir='models'):
+    """
+    Load the latest model artifact
+
+    Returns:
+    --------
+    (model, info), or (None, None) if no model was trained yet
+    """
+    import joblib
+
+    info = read_model_info(model_dir)
+    if info is None:
+        return None, None
+    return joblib.load(os.path.join(model_dir, info['path'])), info
+
+
+if __name__ == "__main__":
+    from result_store import ResultStore
+
+    parser = argparse.ArgumentParser(description="Train the encroachment risk model")
+    parser.add_argument('roads', nargs='*', help="Road ids to train on (default: all stored)")
+    parser.add_argument('--results', default='results')
+    parser.add_argument('--models', default='models')
+    parser.add_argument('--test-size', type=float, default=0.2)
+    args = parser.parse_args()
+
+    store = ResultStore(args.results)
+    road_ids = args.roads or list(store.read_manifest()['roads'])
+    # Features per road so each reuses its cached neighbourhood features
+    tables = [store.load_table(road_id).to_pandas() for road_id in road_ids]
+    features = pd.concat([
+        build_features(table, cache_path=store.feature_cache_path(road_id))
+        for road_id, table in zip(road_ids, tables)
+    ], ignore_index=True)
+    labels = np.concatenate([table['is_encroachment'].to_numpy() for table in tables])
+
+    model, info = train_model(features, labels, test_size=args.test_size)
+    info['roads'] = road_ids
+    print(save_model(model, info, args.models))
+    print(json.dumps(info['metrics'], indent=2))
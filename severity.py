@@ -0,0 +1,56 @@
+"""
+Severity
+Shared severity classification of buildings by distance from the road
+
+Severity grades how deep a building sits inside the road reserve, as the
+fraction of the reserve width left between it and the centerline. Bins are
+closed on the left, so a building on the centerline is Critical and one
+exactly at the reserve boundary is Compliant, matching the encroachment
+test ``distance < reserve width``. Classification is one ``np.searchsorted``
+over the bin edges for all buildings, returning ordered categorical codes.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# Labels from the most severe; the last one is outside the reserve
+SEVERITY_LABELS = ('Critical', 'High', 'Moderate', 'Compliant')
+ENCROACHING_LEVELS = SEVERITY_LABELS[:-1]
+
+# Lower edges of every label after the first, as fractions of the reserve width
+SEVERITY_EDGES = (1 / 3, 2 / 3, 1)
+
+
+def classify_severity(distance, reserve_width=30, edges=SEVERITY_EDGES,
+                      labels=SEVERITY_LABELS):
+    """
+    Severity of each building from its distance to the road
+
+    Parameters:
+    -----------
+    distance : array-like
+        Distance in meters from the road centerline
+    reserve_width : float or array-like
+        Reserve width in meters, one value or one per building
+    edges : sequence of float
+        Increasing bin edges as fractions of the reserve width; a building
+        at ``edges[i - 1] <= distance / reserve_width < edges[i]`` gets
+        ``labels[i]``
+    labels : sequence of str
+        One label more than there are edges
+
+    Returns:
+    --------
+    Ordered Categorical; buildings without a distance are missing
+    """
+    if len(labels) != len(edges) + 1:
+        raise ValueError("Severity needs exactly one more label than bin edges")
+
+    ratio = np.atleast_1d(
+        np.asarray(distance, dtype=float) / np.asarray(reserve_width, dtype=float)
+    )
+    codes = np.searchsorted(np.asarray(edges, dtype=float), ratio, side='right')
+    codes[np.isnan(ratio)] = -1
+
+    return pd.Categorical.from_codes(codes, categories=list(labels), ordered=True)
@@ -0,0 +1,32 @@
+from change_detection import encroachment_transitions, monthly_change_series
+from data_loader import EncroachmentDataLoader, create_synthetic_city
+from result_store import ResultStore
+
+
+def save_snapshot(store, roads, buildings, date):
+    loader = EncroachmentDataLoader()
+    loader.road_gdf = roads
+    loader.buildings_gdf = buildings.copy()
+    loader.identify_encroachments(reserve_widths=True)
+    loader.save_results(store, 'ORR-001', snapshot_date=date)
+    return loader.buildings_gdf
+
+
+def test_removed_buildings_are_resolved_and_nothing_is_new(tmp_path):
+    roads, buildings = create_synthetic_city(3000)
+    store = ResultStore(str(tmp_path))
+
+    first = save_snapshot(store, roads, buildings, '2026-01-15')
+    encroaching = first.index[first['is_encroachment'].to_numpy(dtype=bool)]
+    removed = encroaching[::10][:55]
+    save_snapshot(store, roads, buildings.drop(removed), '2026-02-15')
+
+    transitions = encroachment_transitions(store.load_snapshots('ORR-001'))
+    counts = transitions['status'].value_counts()
+    assert counts.get('new', 0) == 0
+    assert counts.get('resolved', 0) == len(removed) == 55
+    assert counts.get('persisting', 0) == len(encroaching) - 55
+
+    monthly = monthly_change_series(transitions)
+    assert monthly.loc['2026-02', 'resolved'] == 55
+    assert monthly.loc['2026-02', 'new'] == 0
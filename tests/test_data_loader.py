@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_loader import (
+    EncroachmentDataLoader, ROAD_RESERVE_WIDTHS, create_synthetic_city, feature_keys
+)
+from result_store import ResultStore
+
+
+def loader_for(roads, buildings):
+    loader = EncroachmentDataLoader()
+    loader.road_gdf = roads
+    loader.buildings_gdf = buildings.copy()
+    return loader
+
+
+def test_update_results_recomputes_everything_when_only_the_widths_change(tmp_path):
+    roads, buildings = create_synthetic_city(2000)
+    store = ResultStore(str(tmp_path))
+
+    first = loader_for(roads, buildings).update_results(store, 'ORR-001', reserve_widths=True)
+    assert first['recomputed'] == len(buildings)
+
+    # Same snapshot and widths: nothing to redo
+    repeat = loader_for(roads, buildings).update_results(store, 'ORR-001', reserve_widths=True)
+    assert repeat['recomputed'] == 0
+
+    widths = dict(ROAD_RESERVE_WIDTHS, residential=ROAD_RESERVE_WIDTHS['residential'] * 2)
+    loader = loader_for(roads, buildings)
+    changed = loader.update_results(store, 'ORR-001', reserve_widths=widths)
+    assert changed['recomputed'] == len(buildings)
+
+    stored = store.load_road('ORR-001')
+    residential = stored['road_class'].to_numpy() == 'residential'
+    assert residential.any()
+    assert np.all(stored['reserve_width_m'].to_numpy()[residential] == widths['residential'])
+    np.testing.assert_array_equal(
+        stored['is_encroachment'].to_numpy(),
+        stored['distance_meters'].to_numpy() < stored['reserve_width_m'].to_numpy()
+    )
+
+
+def test_update_results_keys_osmnx2_buildings_by_element_and_id(tmp_path):
+    roads, buildings = create_synthetic_city(2000)
+    assert list(buildings.index.names) == ['element', 'id']
+    store = ResultStore(str(tmp_path))
+
+    loader_for(roads, buildings).update_results(store, 'ORR-001', reserve_widths=True)
+    repeat = loader_for(roads, buildings).update_results(store, 'ORR-001', reserve_widths=True)
+    assert repeat['recomputed'] == 0
+
+    moved = buildings.copy()
+    moved.geometry = moved.geometry.translate(xoff=0.0001)
+    changed = loader_for(roads, moved.iloc[:10]).update_results(
+        store, 'ORR-001', reserve_widths=True
+    )
+    assert changed['recomputed'] == 10
+
+
+def test_feature_keys_require_osm_identifiers():
+    frame = pd.DataFrame({'building': ['house', 'shop']})
+    with pytest.raises(ValueError):
+        feature_keys(frame)
+
+
+def test_chainage_of_a_divided_road_follows_one_reference_line():
+    import geopandas as gpd
+    import shapely
+
+    # Carriageways 20 m apart, eastbound on the north side and westbound on
+    # the south side, each split into 500 m edges
+    x = np.arange(0, 2001, 500.0)
+    east = [shapely.LineString([(a, 10), (b, 10)]) for a, b in zip(x[:-1], x[1:])]
+    west = [shapely.LineString([(b, -10), (a, -10)]) for a, b in zip(x[:-1], x[1:])]
+    roads = gpd.GeoDataFrame(
+        {'name': 'Outer Ring Road', 'highway': 'trunk'},
+        geometry=east + west,
+        crs="EPSG:32737",
+        index=pd.MultiIndex.from_arrays(
+            [np.arange(8), np.arange(8) + 100, np.zeros(8, dtype=int)], names=['u', 'v', 'key']
+        )
+    )
+    # Two buildings facing each other across the road 100 m from the start
+    buildings = gpd.GeoDataFrame(
+        {'building': 'house'},
+        geometry=[shapely.box(95, 25, 105, 35), shapely.box(95, -35, 105, -25)],
+        crs="EPSG:32737",
+        index=pd.MultiIndex.from_arrays([['way', 'way'], [1, 2]], names=['element', 'id'])
+    )
+
+    loader = loader_for(roads, buildings)
+    loader.calculate_distances()
+    result = loader.calculate_chainage(segment_length=100)
+
+    chainage = result['chainage_m'].to_numpy()
+    assert abs(chainage[0] - chainage[1]) < 1
+    assert result['segment'].nunique() == 1
+
+
+def test_update_results_reuses_a_version_written_by_save_results(tmp_path):
+    roads, buildings = create_synthetic_city(2000)
+    store = ResultStore(str(tmp_path))
+
+    loader = loader_for(roads, buildings)
+    loader.identify_encroachments(threshold=25, mode='distance', reserve_widths=True)
+    loader.save_results(store, 'ORR-001')
+    entry = store.get_entry('ORR-001')
+    assert (entry['threshold'], entry['mode']) == (25, 'distance')
+
+    update = loader_for(roads, buildings).update_results(
+        store, 'ORR-001', threshold=25, mode='distance', reserve_widths=True
+    )
+    assert update['recomputed'] == 0
+
+
+def test_process_in_chunks_writes_tag_columns_mixing_lists_and_strings(tmp_path):
+    import geopandas as gpd
+
+    roads, buildings = create_synthetic_city(600)
+    # Merged OSM ways carry list-valued tags next to plain strings
+    buildings['name'] = pd.Series(
+        [['Block A', 'Block B'] if i % 3 == 0 else 'Block C' for i in range(len(buildings))],
+        index=buildings.index, dtype=object
+    )
+    loader = EncroachmentDataLoader()
+    loader.road_gdf = roads
+
+    summary = loader.process_in_chunks(
+        [buildings.iloc[:300], buildings.iloc[300:]], str(tmp_path / 'parts')
+    )
+
+    assert summary['total_buildings'] == len(buildings)
+    parts = pd.concat([gpd.read_parquet(path) for path in summary['parts']])
+    assert parts['name'].iloc[0] == '["Block A", "Block B"]'
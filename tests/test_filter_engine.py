@@ -0,0 +1,51 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from filter_engine import FilterIndex
+
+
+def frame(n=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'severity': rng.choice(['Critical', 'High', 'Moderate', 'Compliant'], n),
+        'building_type': rng.choice(['house', 'shop', 'yes'], n),
+        'area': rng.random(n),
+    })
+
+
+def test_rows_match_a_plain_filter_and_are_not_cached():
+    df = frame()
+    index = FilterIndex(df, ['severity', 'building_type'])
+    selection = {'severity': ['Critical', 'High'], 'building_type': ['shop']}
+
+    rows = index.rows(**selection)
+    expected = df[df['severity'].isin(['Critical', 'High']) & (df['building_type'] == 'shop')]
+    pd.testing.assert_frame_equal(rows, expected)
+    assert index.aggregate('area', lambda rows: rows['area'].sum(), **selection) == (
+        expected['area'].sum()
+    )
+
+    # Only the selection bitmap and the small aggregate are kept
+    assert not any(isinstance(value, pd.DataFrame) for value in index._cache.values())
+
+
+def test_cache_stays_bounded_under_concurrent_selections():
+    df = frame()
+    index = FilterIndex(df, ['severity', 'building_type'], cache_size=8)
+    values = ['Critical', 'High', 'Moderate', 'Compliant']
+
+    def query(i):
+        for j in range(50):
+            chosen = [values[(i + j) % 4], values[(i + 2 * j) % 4]]
+            mask = index.mask(severity=chosen)
+            assert mask.sum() == df['severity'].isin(chosen).sum()
+
+    threads = [threading.Thread(target=query, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(index._cache) <= 8
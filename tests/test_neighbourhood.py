@@ -0,0 +1,24 @@
+import numpy as np
+
+from neighbourhood import compute_neighbourhood_features
+
+
+def test_coincident_footprints_are_each_others_nearest_encroacher():
+    # Two encroachers on the same point, one further along, one compliant
+    # building on the shared point
+    x = np.array([0.0, 0.0, 30.0, 0.0])
+    y = np.array([0.0, 0.0, 40.0, 0.0])
+    encroaching = np.array([True, True, True, False])
+
+    features = compute_neighbourhood_features(x, y, encroaching, radius=10)
+
+    np.testing.assert_allclose(features['nearest_encroacher_m'], [0.0, 0.0, 50.0, 0.0])
+    np.testing.assert_array_equal(features['neighbour_count'], [2, 2, 0, 2])
+
+
+def test_single_encroacher_has_no_other_encroacher():
+    features = compute_neighbourhood_features(
+        [0.0, 3.0], [0.0, 4.0], [True, False], max_distance=1000
+    )
+
+    np.testing.assert_allclose(features['nearest_encroacher_m'], [1000.0, 5.0])
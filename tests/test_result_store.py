@@ -0,0 +1,64 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_loader import EncroachmentDataLoader, create_synthetic_city
+from result_store import ResultStore
+
+
+def analysed_loader(n_buildings=5000):
+    roads, buildings = create_synthetic_city(n_buildings)
+    loader = EncroachmentDataLoader()
+    loader.road_gdf = roads
+    loader.buildings_gdf = buildings
+    loader.identify_encroachments(reserve_widths=True)
+    return loader
+
+
+def mapped_ranges(path):
+    ranges = []
+    with open('/proc/self/maps') as f:
+        for line in f:
+            if line.rstrip().endswith(path):
+                start, end = line.split()[0].split('-')
+                ranges.append((int(start, 16), int(end, 16)))
+    return ranges
+
+
+def column_address(series):
+    values = series.array
+    array = values.codes if isinstance(values, pd.Categorical) else np.asarray(values)
+    return array.__array_interface__['data'][0]
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="reads /proc/self/maps")
+def test_load_results_columns_point_into_the_mapped_file(tmp_path):
+    store = ResultStore(str(tmp_path))
+    analysed_loader().save_results(store, 'ORR-001')
+
+    results = store.load_results('ORR-001')
+    path = os.path.realpath(os.path.join(store.root, store.get_entry('ORR-001')['table_path']))
+    ranges = mapped_ranges(path)
+    assert ranges
+
+    # Booleans are bit-packed in Arrow and have to be unpacked
+    for column in results.columns.drop('is_encroachment'):
+        address = column_address(results[column])
+        assert any(start <= address < end for start, end in ranges), column
+
+    assert results['distance_meters'].dtype == np.float32
+    assert isinstance(results['severity'].dtype, pd.CategoricalDtype)
+
+
+def test_compact_results_keep_the_osm_identity_of_osmnx2_buildings(tmp_path):
+    store = ResultStore(str(tmp_path))
+    loader = analysed_loader(n_buildings=500)
+    ids = loader.buildings_gdf.index.get_level_values('id').to_numpy()
+    loader.save_results(store, 'ORR-001')
+
+    results = store.load_results('ORR-001')
+    np.testing.assert_array_equal(results['osmid'].to_numpy(), ids)
+    assert set(results['element_type'].astype(str)) == {'way'}